@@ -1,34 +1,41 @@
 # app.py (Corregido - ValueError en plotly.update_yaxes)
 
 # Importar librerías (igual que antes)
+import time
+_inicio_ejecucion = time.perf_counter()
 import streamlit as st
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import IsolationForest
-import plotly.express as px
-import time
-from pythonping import ping
-import psutil
-import speedtest
 import datetime
+import tempfile
+from colector import agregar_por_segundo, obtener_colector
+from almacen import INTERVALO_VOLCADO_S, obtener_almacen
+from muestreo import METRICAS, tasa_total
+from anomalias import CAPACIDAD_LINEA_BASE, DetectorEWMA, detectar_anomalias, obtener_motor, obtener_motor_multivariante
+from graficos import GraficoTasa, crear_grafico_plotly_tasa
+from trabajos import COMPLETADO, obtener_ejecutor_speedtest
+from sondeo import MODOS as MODOS_SONDEO, PUERTO_TCP, expandir_destinos, sondear_destinos
+from flujos import leer_pcap, obtener_captura
+from tarjetas import create_metric_card
+from instrumentacion import medida, obtener_instrumentacion
 
 # --- Configuración (igual que antes) ---
-CONTAMINACION_ESPERADA = 'auto'
-ESTADO_ALEATORIO = 42
 DURACION_MONITORIZACION_S = 15
+INTERVALO_DIRECTO_S = 2
 USUARIOS_VALIDOS = { "Ivan123": "Ivan123", "Marcos123": "Marcos123" }
 LATENCIA_RAPIDA_MS = 80
 LATENCIA_ACEPTABLE_MS = 200
 PERDIDA_PAQUETES_MAX_PERMITIDA = 0.5
+PRESUPUESTO_ARRANQUE_S = 3.0   # Primera ejecución del proceso (incluye importaciones)
+PRESUPUESTO_RERUN_MS = 150      # Cada ejecución posterior del script completo
+MODOS_DETECCION = ("Tasa total", "Multivariante (interfaces y métricas)")
+PERIODOS_HISTORIAL = {"Última hora": (3600, "1s"), "Últimas 24 h": (86400, "1min"), "Últimos 7 días": (7 * 86400, "1h")}
 
 # --- Funciones Auxiliares ---
-def detectar_anomalias_serie(serie_datos):
-    if serie_datos is None or len(serie_datos) < 5: return np.array([])
+def detectar_anomalias_serie(serie_datos, tiempos=None):
     try:
-        X = np.array(serie_datos).reshape(-1, 1); X_clean = X[np.isfinite(X)].reshape(-1, 1)
-        if len(X_clean) < 5: return np.array([])
-        modelo = IsolationForest(contamination=CONTAMINACION_ESPERADA, random_state=ESTADO_ALEATORIO).fit(X_clean)
-        predicciones = modelo.predict(X); return np.where(predicciones == -1)[0]
+        # Motor compartido: reutiliza el modelo ajustado sobre la línea base y solo puntúa la ventana
+        return detectar_anomalias(serie_datos, tiempos)
     except ValueError as ve:
         if "Input contains NaN, infinity or a value too large" in str(ve): st.warning("Advertencia ML: Datos con NaN/Inf."); return np.array([])
         else: st.error(f"Error ML (Valor): {ve}"); return np.array([])
@@ -41,71 +48,370 @@ def sugerir_solucion_tasa(tasa_bps):
     elif tasa_bps < 1*1024 and tasa_bps >= 0: return f"**Tasa MUY BAJA** ({tasa_bps/1024:.1f} KB/s). Normal si no hay actividad. Si se esperaba, ¿problema conexión?"
     else: return f"Tasa local: {tasa_bps/(1024*1024):.2f} MB/s (normal)."
 
-# --- FUNCIÓN MODIFICADA ---
-def crear_grafico_plotly_tasa(serie_tasas, anomalias_indices):
-    if serie_tasas is None or len(serie_tasas) == 0: return None
-    df = pd.DataFrame({'Segundo': np.arange(len(serie_tasas)), 'Tasa (Bytes/s)': serie_tasas}); df['Estado'] = 'Normal'
-    valid_anomalias_indices = [idx for idx in anomalias_indices if idx < len(df)]
-    if len(valid_anomalias_indices) > 0: df.loc[valid_anomalias_indices, 'Estado'] = 'Anomalía'
-    fig = px.line(df, x='Segundo', y='Tasa (Bytes/s)', title=f'📈 Actividad de Red Local ({len(serie_tasas)} seg.)', markers=True, labels={'Segundo': 'Tiempo (s)', 'Tasa (Bytes/s)': 'Tasa (Bytes/s)'})
-    df_anomalias = df[df['Estado'] == 'Anomalía']
-    if not df_anomalias.empty: fig.add_scatter(x=df_anomalias['Segundo'], y=df_anomalias['Tasa (Bytes/s)'], mode='markers', marker=dict(color='red', size=10), name='Anomalía Detectada', hovertemplate="Seg: %{x}<br>Tasa: %{y:,.0f} B/s<br><b>Anomalía</b><extra></extra>")
-    fig.update_traces(hovertemplate="Seg: %{x}<br>Tasa: %{y:,.0f} B/s<br>Normal<extra></extra>")
-    fig.update_layout(hovermode='x unified', legend_title_text='Estado')
-
-    # ***** INICIO DE LA CORRECCIÓN (Lógica de escala Y) *****
-    if not df['Tasa (Bytes/s)'].empty:
-        max_val = df['Tasa (Bytes/s)'].dropna().max()
-        if pd.notna(max_val) and max_val > 0:
-             # Asignar directamente los valores válidos para Plotly ('log' o 'linear')
-             escala_plotly = 'log' if max_val > 50000 else 'linear' # 'linear' es el valor correcto
-             # Crear texto para mostrar (con mayúscula inicial)
-             escala_display = escala_plotly.capitalize() # Obtiene 'Log' o 'Linear'
-             # Usar los valores correctos en update_yaxes
-             fig.update_yaxes(type=escala_plotly, title_text=f"Tasa (Bytes/s) - Escala {escala_display}")
-    # ***** FIN DE LA CORRECCIÓN *****
-    return fig
-# --- FIN FUNCIÓN MODIFICADA ---
-
-def realizar_ping(host, count=4):
-    try: return ping(host, count=count, verbose=False, timeout=2)
-    except PermissionError: st.error(f"⛔ Error Permisos Ping a {host}."); return None
-    except Exception as e: st.error(f"⛔ Error Ping a {host}: {e}"); return None
-
-def realizar_speedtest():
-    try:
-        st_test = speedtest.Speedtest(secure=True); st_test.get_best_server(); st_test.download(); st_test.upload()
-        return st_test.results.dict()
-    except speedtest.SpeedtestException as e: st.error(f"⛔ Error Speedtest: {e}"); return None
-    except Exception as e: st.error(f"⛔ Error inesperado Speedtest: {e}"); return None
+# --- Gráfico en directo: la figura se conserva entre refrescos y solo recibe las muestras nuevas ---
+@st.fragment(run_every=INTERVALO_DIRECTO_S)
+def mostrar_grafico_directo():
+    colector = obtener_colector()
+    estado = st.session_state.get('grafico_directo')
+    if estado is None:
+        # Arranca con el último minuto ya recogido para no empezar con un gráfico vacío
+        estado = st.session_state.grafico_directo = {"grafico": GraficoTasa(), "detector": DetectorEWMA(), "t0": None,
+                                                     "leidos": colector.buffer.escritos - int(60 / colector.intervalo_s)}
+    tiempos, tasas, estado["leidos"] = colector.buffer.desde(estado["leidos"])
+    if len(tiempos) > 0:
+        if estado["t0"] is None: estado["t0"] = tiempos[0]
+        valores = tasa_total(tasas)
+        estado["grafico"].agregar(tiempos - estado["t0"], valores, estado["detector"].actualizar_lote(valores))
+    st.plotly_chart(estado["grafico"].figura, use_container_width=True, key="live_chart_tab1")
+
+@st.cache_data(ttl=INTERVALO_VOLCADO_S, show_spinner=False)
+def consultar_historial(segundos, nivel, tramo):
+    # 'tramo' cambia con cada volcado del almacén: antes de eso la consulta devolvería lo mismo
+    hasta = (tramo + 1) * INTERVALO_VOLCADO_S
+    return obtener_almacen().consultar("trafico", hasta - segundos, hasta, ["tasa_bps"], nivel)
+
+def figura_monitor(resultados):
+    # La figura solo se reconstruye cuando cambia el resultado (su 'id'), no en cada ejecución del script
+    cache = st.session_state.get('figura_monitor_cache')
+    if cache is None or cache[0] != resultados["id"]:
+        cache = st.session_state.figura_monitor_cache = (resultados["id"], crear_grafico_plotly_tasa(resultados["serie_tasas"], resultados["anomalias_indices"]))
+    return cache[1]
+
+def resumir_interfaces(tasas_interfaces, interfaces):
+    if tasas_interfaces is None or len(tasas_interfaces) == 0: return None
+    # Media y pico de todas las interfaces/métricas en una sola pasada vectorizada sobre (muestra, interfaz, métrica)
+    with np.errstate(all='ignore'):
+        medias = np.nanmean(tasas_interfaces, axis=0); picos = np.nanmax(tasas_interfaces, axis=0)
+    resumen = pd.DataFrame({
+        'Media Envío (B/s)': medias[:, METRICAS.index('bytes_sent')], 'Pico Envío (B/s)': picos[:, METRICAS.index('bytes_sent')],
+        'Media Recepción (B/s)': medias[:, METRICAS.index('bytes_recv')], 'Pico Recepción (B/s)': picos[:, METRICAS.index('bytes_recv')],
+        'Paquetes/s': medias[:, METRICAS.index('packets_sent')] + medias[:, METRICAS.index('packets_recv')],
+        'Errores/s': medias[:, METRICAS.index('errin')] + medias[:, METRICAS.index('errout')],
+        'Descartes/s': medias[:, METRICAS.index('dropin')] + medias[:, METRICAS.index('dropout')],
+    }, index=pd.Index(interfaces, name='Interfaz'))
+    return resumen.round(1)
+
+def tabla_resultados_ping(resultados):
+    columnas = {'host': 'Destino', 'modo': 'Modo', 'rtt_avg_ms': 'Media (ms)', 'p50_ms': 'p50 (ms)', 'p95_ms': 'p95 (ms)',
+                'p99_ms': 'p99 (ms)', 'jitter_ms': 'Jitter (ms)', 'perdida': 'Pérdida', 'error': 'Error'}
+    tabla = pd.DataFrame(resultados).reindex(columns=list(columnas)).rename(columns=columnas)
+    return tabla.replace([np.inf, -np.inf], np.nan).round(2)
+
+def guardar_resultados_ping(resultados):
+    almacen = obtener_almacen(); ahora = time.time()
+    for r in resultados:
+        if 'error' in r: continue
+        # Los destinos sin respuesta quedan como NaN (la pérdida ya lo refleja) para no distorsionar los agregados
+        valores = {k: (r[k] if np.isfinite(r[k]) else None) for k in ('rtt_avg_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'jitter_ms')}
+        almacen.agregar_registro(f"ping/{r['host']}", ahora, perdida=r['perdida'], **valores)
+
+# --- Flujos ("top talkers"): captura compartida por el proceso o análisis de un pcap subido ---
+def alternar_captura():
+    captura = obtener_captura()
+    if st.session_state.capture_toggle_tab1: captura.iniciar()
+    else: captura.detener()
+
+def tablas_flujos(agregador, n=10):
+    # Hosts, puertos y procesos salen de los resúmenes top-K (memoria acotada); 'error_max' es su posible sobreestimación
+    return {"Flujos": pd.DataFrame(agregador.top_flujos(n)), "Hosts": pd.DataFrame(agregador.top_hosts(n)),
+            "Puertos": pd.DataFrame(agregador.top_puertos(n)), "Procesos": pd.DataFrame(agregador.top_procesos(n))}
+
+@st.cache_data(show_spinner="Analizando pcap...", max_entries=4)
+def analizar_pcap(contenido):
+    with tempfile.NamedTemporaryFile(suffix=".pcap") as f:
+        f.write(contenido); f.flush()
+        agregador = leer_pcap(f.name)
+    return agregador.paquetes, tablas_flujos(agregador)
+
+def flujos_de_segundo(t):
+    # Cada punto de la serie es la tasa del segundo que termina en 't'
+    agregador = obtener_captura().agregador
+    return pd.DataFrame(agregador.flujos_en(t - 1, t, n=3)) if agregador.paquetes else None
+
+# --- Seguimiento del speedtest en segundo plano: solo se refresca este fragmento mientras el trabajo sigue en curso ---
+@st.fragment(run_every=1)
+def seguir_speedtest():
+    trabajo = st.session_state.get('speedtest_job')
+    if trabajo is None: return
+    if not trabajo.terminado:
+        st.info(f"⚙️ Ejecutando test de velocidad en segundo plano... ({time.time() - trabajo.inicio:.0f} s)")
+        return
+    # Al terminar se relanza la página completa para mostrar los resultados
+    recoger_speedtest(trabajo); st.rerun(scope="app")
+
+def programar_speedtest():
+    minutos = st.session_state.speedtest_schedule_tab3; ejecutor = obtener_ejecutor_speedtest()
+    if minutos: ejecutor.programar(minutos * 60)
+    else: ejecutor.detener_programacion()
+
+def recoger_speedtest(trabajo):
+    st.session_state.speedtest_job = None
+    if trabajo.estado == COMPLETADO: st.session_state.speedtest_results = trabajo.resultado
+    else: st.session_state.speedtest_error = trabajo.error
+
 # ---------------------------------------------------------------------
 
 # --- Función para Cargar CSS desde archivo ---
+@st.cache_data(show_spinner=False)
+def leer_css(file_path):
+    with open(file_path) as f: return f.read()
+
 def load_css_from_file(file_path):
     try:
-        with open(file_path) as f:
-            st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+        st.markdown(f"<style>{leer_css(file_path)}</style>", unsafe_allow_html=True)
     except FileNotFoundError:
         st.error(f"Error: Archivo CSS no encontrado en {file_path}")
 
-# --- Función para crear Tarjetas HTML ---
-def create_metric_card(title, value, icon="", key_suffix=""):
-    display_value = "N/A"
-    if value is not None and np.isfinite(value):
-        if isinstance(value, float):
-            if "Perdidos" in title: display_value = f"{value:.1%}"
-            elif "Mbps" in title: display_value = f"{value:.2f}<span style='font-size: 0.6em;'> Mbps</span>"
-            elif "ms" in title: display_value = f"{value:.2f}<span style='font-size: 0.6em;'> ms</span>"
-            else: display_value = f"{value:,.2f}"
-        elif isinstance(value, int): display_value = f"{value:,}"
-        else: display_value = str(value)
-    card_html = f"""
-    <div class="metric-card" key="card-{key_suffix}">
-        <div class="icon">{icon}</div>
-        <h3>{title}</h3>
-        <div class="value">{display_value}</div>
-    </div>"""
-    return card_html
+# --- Pestañas: cada una es un fragmento, así un widget de una pestaña solo vuelve a ejecutar esa pestaña ---
+@st.fragment
+@medida("app.monitor")
+def pestana_monitor():
+    st.subheader("Monitorizar Actividad de Red Local")
+    st.caption(f"Analiza la tasa de Bytes/s de los últimos {DURACION_MONITORIZACION_S} seg. (muestreo continuo en segundo plano) y detecta anomalías.")
+    modo_deteccion = st.radio("Detección", MODOS_DETECCION, horizontal=True, key="detection_mode_tab1",
+                              help="'Multivariante' puntúa a la vez bytes, paquetes, errores y descartes de cada interfaz e indica la causa.")
+    if st.button(f"⏱️ Iniciar Monitorización Local", key="start_monitor_tab1"):
+        st.session_state.monitor_results = None
+        colector = obtener_colector()
+        try:
+            # Una sola instantánea del colector para la serie total y el modo multivariante: mismos segundos en ambos
+            tiempos_muestras, tasas_muestras = colector.ventana_interfaces(CAPACIDAD_LINEA_BASE)
+            tiempos_base, serie_base = agregar_por_segundo(tiempos_muestras, tasa_total(tasas_muestras), colector.intervalo_s) if len(tiempos_muestras) > 0 else (np.array([]), np.array([]))
+            tiempos_tasas, serie_tasas = tiempos_base[-DURACION_MONITORIZACION_S:], serie_base[-DURACION_MONITORIZACION_S:]
+            if colector.error: st.warning(f"⚠️ Colector: {colector.error}")
+            if len(serie_tasas) > 0:
+                if len(serie_tasas) < DURACION_MONITORIZACION_S:
+                    st.info(f"ℹ️ El colector acaba de arrancar: {len(serie_tasas)}/{DURACION_MONITORIZACION_S} seg. disponibles.")
+                serie_tasas_numeric = pd.to_numeric(serie_tasas, errors='coerce')
+                # La línea base del motor se alimenta con todo el historial del colector, no solo con las ventanas consultadas
+                obtener_motor().observar(tiempos_base, serie_base)
+                causas = {}
+                if modo_deteccion == MODOS_DETECCION[1]:
+                    tiempos_interfaces, tasas_por_segundo = agregar_por_segundo(tiempos_muestras, tasas_muestras, colector.intervalo_s)
+                    multivariante = obtener_motor_multivariante().procesar(tiempos_interfaces, tasas_por_segundo, len(serie_tasas), colector.interfaces)
+                    anomalias_indices = multivariante["indices"]; causas = multivariante["causas"]
+                else: anomalias_indices = detectar_anomalias_serie(serie_tasas_numeric, tiempos_tasas)
+                _, tasas_interfaces = colector.ventana_interfaces(DURACION_MONITORIZACION_S)
+                st.session_state.monitor_results = {"id": time.monotonic_ns(), "serie_tasas": serie_tasas_numeric, "tiempos": tiempos_tasas, "anomalias_indices": anomalias_indices,
+                                                    "causas": causas, "resumen_interfaces": resumir_interfaces(tasas_interfaces, colector.interfaces)}
+            else: st.warning("⚠️ Aún no hay datos en el colector. Vuelve a intentarlo en unos segundos.")
+        except Exception as e:
+            st.error(f"❌ Error en Monitorización. Detalle: {e}")
+            st.session_state.monitor_results = None
+
+    if st.session_state.monitor_results:
+        st.markdown('<hr class="custom-hr">', unsafe_allow_html=True)
+        st.subheader("Resultados del Monitor Local")
+        serie = st.session_state.monitor_results["serie_tasas"]; indices_anomalos = st.session_state.monitor_results["anomalias_indices"]
+        tiempos_serie = st.session_state.monitor_results.get("tiempos"); causas = st.session_state.monitor_results.get("causas") or {}
+        figura_plotly = figura_monitor(st.session_state.monitor_results)
+        if figura_plotly: st.plotly_chart(figura_plotly, use_container_width=True)
+        else: st.warning("⚠️ No se pudo generar el gráfico.")
+
+        with st.expander("🔍 Ver Detalles de Anomalías Detectadas"):
+            indices_validos = [idx for idx in indices_anomalos if idx < len(serie)]
+            if len(indices_validos) > 0:
+                st.write("**Segundos con actividad anómala y sugerencias:**")
+                for idx in indices_validos:
+                    valor_tasa = serie[idx]
+                    if pd.notna(valor_tasa):
+                        solucion = sugerir_solucion_tasa(valor_tasa)
+                        col1_exp, col2_exp = st.columns([1, 3])
+                        with col1_exp:
+                            st.warning(f"Seg. *{idx+1}* ➡️ `{valor_tasa:,.0f}` B/s")
+                        with col2_exp:
+                            st.info(f"💡 {solucion}")
+                            # Modo multivariante: interfaz y característica que más se desviaron en ese segundo
+                            for causa in causas.get(int(idx), []):
+                                st.caption(f"🧭 **{causa['interfaz']}** · `{causa['caracteristica']}` = {causa['valor']:,.1f} (z = {causa['z']:+.1f})")
+                            # Con la captura de paquetes activa, los flujos que más bytes movieron en ese segundo
+                            flujos_anomalia = flujos_de_segundo(tiempos_serie[idx]) if tiempos_serie is not None else None
+                            if flujos_anomalia is not None and not flujos_anomalia.empty:
+                                st.dataframe(flujos_anomalia, use_container_width=True, hide_index=True)
+                    else: # Manejo de NaN
+                        col1_exp, col2_exp = st.columns([1, 3])
+                        with col1_exp:
+                            st.warning(f"Seg. *{idx+1}* ➡️ `NaN`")
+                        with col2_exp:
+                            st.info("Valor no numérico.")
+            else:
+                st.success("✅ No se detectaron anomalías significativas.")
+
+        resumen_interfaces = st.session_state.monitor_results.get("resumen_interfaces")
+        if resumen_interfaces is not None and not resumen_interfaces.empty:
+            with st.expander("🔌 Ver Detalle por Interfaz y Dirección"):
+                st.caption(f"Media y pico por interfaz (muestreo cada {obtener_colector().intervalo_s:g} s; el pico revela microráfagas).")
+                st.dataframe(resumen_interfaces, use_container_width=True)
+    else:
+        st.info("ℹ️ Inicia la monitorización para ver resultados.")
+
+    with st.expander("🔬 Ver Top Talkers (Captura de Paquetes)"):
+        captura = obtener_captura()
+        st.toggle("Capturar paquetes en directo", value=captura.activa, key="capture_toggle_tab1", on_change=alternar_captura,
+                  help="Compartida por todos los usuarios. Requiere root/CAP_NET_RAW; con ella activa, las anomalías muestran sus flujos.")
+        if captura.error: st.error(f"⛔ Captura: {captura.error}")
+        if captura.agregador.paquetes:
+            st.caption(f"{captura.agregador.paquetes:,} paquetes, {captura.agregador.bytes:,} bytes, {len(captura.agregador.flujos):,} flujos en memoria.")
+            for titulo, tabla in tablas_flujos(captura.agregador).items():
+                if not tabla.empty: st.write(f"**{titulo}**"); st.dataframe(tabla, use_container_width=True, hide_index=True)
+        fichero_pcap = st.file_uploader("Analizar un fichero pcap/pcapng", type=["pcap", "pcapng", "cap"], key="pcap_upload_tab1")
+        if fichero_pcap is not None:
+            try:
+                paquetes_pcap, tablas_pcap = analizar_pcap(fichero_pcap.getvalue())
+                st.caption(f"{fichero_pcap.name}: {paquetes_pcap:,} paquetes.")
+                for titulo, tabla in tablas_pcap.items():
+                    if not tabla.empty: st.write(f"**{titulo}**"); st.dataframe(tabla, use_container_width=True, hide_index=True)
+            except Exception as e: st.error(f"❌ No se pudo leer el pcap: {e}")
+
+    if st.toggle("📡 Vista en directo", key="live_toggle_tab1", help=f"Refresca cada {INTERVALO_DIRECTO_S} s añadiendo solo los puntos nuevos."):
+        mostrar_grafico_directo()
+    else: st.session_state.pop('grafico_directo', None)
+
+    with st.expander("🗄️ Ver Historial de Tráfico"):
+        periodo_historial = st.selectbox("Periodo", list(PERIODOS_HISTORIAL), key="history_period_tab1")
+        segundos_historial, nivel_historial = PERIODOS_HISTORIAL[periodo_historial]
+        historial = consultar_historial(segundos_historial, nivel_historial, int(time.time() // INTERVALO_VOLCADO_S))
+        if historial.empty: st.info("ℹ️ Aún no hay historial guardado para este periodo.")
+        else:
+            historial.index = pd.to_datetime(historial['t'], unit='s', utc=True)
+            st.caption(f"Agregados de {nivel_historial} (Bytes/s), guardados en disco por el colector.")
+            st.line_chart(historial[['tasa_bps_media', 'tasa_bps_p95', 'tasa_bps_max']].rename(columns={'tasa_bps_media': 'Media', 'tasa_bps_p95': 'p95', 'tasa_bps_max': 'Máximo'}))
+
+@st.fragment
+@medida("app.ping")
+def pestana_ping():
+    st.subheader("Comprobación de Conexión (Ping)")
+    st.caption("Mide la latencia y estabilidad hacia uno o varios destinos en paralelo (hosts, IPs o rangos CIDR separados por comas).")
+    target_host_ping = st.text_input("🌐 Hosts, IPs o rangos destino:", value="8.8.8.8", key="ping_target_tab2")
+    col_modo_ping, col_puerto_ping = st.columns(2)
+    with col_modo_ping: modo_ping = st.selectbox("Modo", MODOS_SONDEO, key="ping_mode_tab2", help="'auto' usa ICMP y pasa a TCP connect si no hay permisos para ICMP.")
+    with col_puerto_ping: puerto_ping = st.number_input("Puerto TCP", min_value=1, max_value=65535, value=PUERTO_TCP, key="ping_port_tab2")
+    if st.button("🚀 Realizar Prueba de Ping", key="start_ping_tab2"):
+        st.session_state.ping_results = None
+        try: destinos_ping = expandir_destinos(target_host_ping) if target_host_ping else []
+        except ValueError as ve: st.error(f"⛔ {ve}"); destinos_ping = None
+        if destinos_ping:
+            resultados_ping = []
+            with st.status(f"📡 Sondeando {len(destinos_ping)} destino(s)...", expanded=True) as status_ping:
+                tabla_parcial = st.empty()
+                # Cada destino se muestra en cuanto responde, sin esperar al más lento
+                for resultado in sondear_destinos(destinos_ping, modo=modo_ping, puerto=int(puerto_ping)):
+                    resultados_ping.append(resultado)
+                    tabla_parcial.dataframe(tabla_resultados_ping(resultados_ping), use_container_width=True)
+                st.session_state.ping_results = resultados_ping
+                guardar_resultados_ping(resultados_ping)
+                if any('error' not in r for r in resultados_ping): status_ping.update(label="✔️ Prueba Ping Completada", state="complete", expanded=False)
+                else: status_ping.update(label="❌ Error en Prueba Ping", state="error")
+        elif destinos_ping is not None: st.warning("⚠️ Introduce un Host o IP.")
+    if st.session_state.ping_results:
+        st.markdown('<hr class="custom-hr">', unsafe_allow_html=True)
+        st.subheader("Resultados del Ping")
+        resultados_ping = st.session_state.ping_results
+        if len(resultados_ping) > 1: st.dataframe(tabla_resultados_ping(resultados_ping), use_container_width=True)
+        for r in resultados_ping:
+            if 'error' in r: st.error(f"⛔ Error Ping a {r['host']}: {r['error']}")
+        hosts_ping = [r['host'] for r in resultados_ping]
+        host_detalle = st.selectbox("Detalle del destino", hosts_ping, key="ping_detail_tab2") if len(hosts_ping) > 1 else hosts_ping[0]
+        results_ping = next(r for r in resultados_ping if r['host'] == host_detalle)
+        avg_ms = results_ping.get('rtt_avg_ms', float('inf')); max_ms = results_ping.get('rtt_max_ms', float('inf')); loss = results_ping.get('perdida', 1.0)
+        col_ping1, col_ping2, col_ping3 = st.columns(3)
+        with col_ping1: st.markdown(create_metric_card("Latencia Media ms", avg_ms, "⏱️", "ping-avg"), unsafe_allow_html=True)
+        with col_ping2: st.markdown(create_metric_card("Latencia Máxima ms", max_ms, "🐢", "ping-max"), unsafe_allow_html=True)
+        with col_ping3: st.markdown(create_metric_card("Paquetes Perdidos", loss, "💔", "ping-loss"), unsafe_allow_html=True)
+        col_ping4, col_ping5, col_ping6 = st.columns(3)
+        with col_ping4: st.markdown(create_metric_card("Latencia p95 ms", results_ping.get('p95_ms'), "📊", "ping-p95"), unsafe_allow_html=True)
+        with col_ping5: st.markdown(create_metric_card("Latencia p99 ms", results_ping.get('p99_ms'), "📈", "ping-p99"), unsafe_allow_html=True)
+        with col_ping6: st.markdown(create_metric_card("Jitter ms", results_ping.get('jitter_ms'), "〰️", "ping-jitter"), unsafe_allow_html=True)
+        with st.expander("💡 Ver Interpretación y Sugerencias del Ping"):
+            velocidad = "Indeterminada"; sugerencia_ping = "No hay sugerencias."
+            if loss > PERDIDA_PAQUETES_MAX_PERMITIDA:
+                velocidad = f"🔴 FALLO (> {PERDIDA_PAQUETES_MAX_PERMITIDA:.0%})"; sugerencia_ping = "Pérdida alta: Problemas serios. Sug: Reinicia, verifica, contacta ISP."; st.error(f"**Estado:** {velocidad}"); st.info(f"**Sugerencia:** {sugerencia_ping}")
+            elif avg_ms == float('inf'):
+                velocidad = f"❓ INALCANZABLE"; sugerencia_ping = "Host no responde. Verifica IP/conexión/firewall."; st.error(f"**Estado:** {velocidad}"); st.info(f"**Sugerencia:** {sugerencia_ping}")
+            elif avg_ms > LATENCIA_ACEPTABLE_MS:
+                velocidad = f"🐌 LENTA (> {LATENCIA_ACEPTABLE_MS} ms)"; sugerencia_ping = f"Latencia alta: Congestión/server lento. Sug: Reinicia, cierra apps, contacta ISP."; st.warning(f"**Estado:** {velocidad}"); st.info(f"**Sugerencia:** {sugerencia_ping}")
+            elif avg_ms > LATENCIA_RAPIDA_MS:
+                velocidad = f"👍 ACEPTABLE ({LATENCIA_RAPIDA_MS}-{LATENCIA_ACEPTABLE_MS} ms)"; sugerencia_ping = "Latencia normal."; st.success(f"**Estado:** {velocidad}"); st.info(f"**Sugerencia:** {sugerencia_ping}")
+            else:
+                velocidad = f"🚀 RÁPIDA (≤ {LATENCIA_RAPIDA_MS} ms)"; sugerencia_ping = "Latencia excelente."; st.success(f"**Estado:** {velocidad}"); st.info(f"**Sugerencia:** {sugerencia_ping}")
+    else: st.info("ℹ️ Realiza una prueba de ping para ver resultados.")
+
+@st.fragment
+@medida("app.speedtest")
+def pestana_speedtest():
+    st.subheader("Test de Velocidad de Conexión a Internet")
+    st.caption("Mide tu velocidad real usando Speedtest.net (~30 seg, en segundo plano: puedes seguir usando las otras pestañas).")
+    st.warning("⚠️ Necesitas `pip install speedtest-cli`.", icon="⚙️")
+    ejecutor_speedtest = obtener_ejecutor_speedtest(obtener_almacen())
+    col_spd_btn, col_spd_prog = st.columns([1, 2])
+    with col_spd_btn: iniciar_speedtest = st.button("💨 Iniciar Test de Velocidad", key="start_speedtest_tab3")
+    with col_spd_prog:
+        # La programación es del proceso (compartida): solo se modifica cuando este usuario cambia el valor
+        st.number_input("Repetir cada (min, 0 = no programar)", min_value=0, max_value=1440, key="speedtest_schedule_tab3",
+                        value=int((ejecutor_speedtest.intervalo_programado_s or 0) // 60), on_change=programar_speedtest,
+                        help="Las ejecuciones programadas se guardan en el historial.")
+    if iniciar_speedtest:
+        st.session_state.speedtest_results = None; st.session_state.speedtest_error = None
+        # Si otro usuario ya lo está ejecutando, se comparte ese trabajo; un resultado reciente se reutiliza
+        trabajo_speedtest = ejecutor_speedtest.solicitar()
+        if trabajo_speedtest.terminado and trabajo_speedtest.fin is not None:
+            st.caption(f"Resultado reciente reutilizado (hace {time.time() - trabajo_speedtest.fin:.0f} s).")
+        st.session_state.speedtest_job = trabajo_speedtest
+    trabajo_speedtest = st.session_state.get('speedtest_job')
+    if trabajo_speedtest is not None:
+        if trabajo_speedtest.terminado: recoger_speedtest(trabajo_speedtest)
+        else: seguir_speedtest()
+    if st.session_state.get('speedtest_error'): st.error(f"⛔ Error Speedtest: {st.session_state.speedtest_error}")
+    if st.session_state.speedtest_results:
+        st.markdown('<hr class="custom-hr">', unsafe_allow_html=True)
+        st.subheader("Resultados del Test de Velocidad")
+        results_speed = st.session_state.speedtest_results
+        download_mbps = results_speed.get('download', 0) / 1_000_000; upload_mbps = results_speed.get('upload', 0) / 1_000_000; ping_ms_speed = results_speed.get('ping', 0)
+        col_spd1, col_spd2, col_spd3 = st.columns(3)
+        with col_spd1: st.markdown(create_metric_card("Velocidad Descarga Mbps", download_mbps, "⬇️", "speed-dl"), unsafe_allow_html=True)
+        with col_spd2: st.markdown(create_metric_card("Velocidad Subida Mbps", upload_mbps, "⬆️", "speed-ul"), unsafe_allow_html=True)
+        with col_spd3: st.markdown(create_metric_card("Ping (Test Server) ms", ping_ms_speed, "↔️", "speed-ping"), unsafe_allow_html=True)
+        with st.expander("📄 Ver Detalles del Test y Evaluación"):
+            server_info = results_speed.get('server', {}); client_info = results_speed.get('client', {})
+            server_loc = server_info.get('location', 'N/A') + ", " + server_info.get('country', 'N/A')
+            st.write(f"**Servidor Test:** {server_info.get('name', 'N/A')} ({server_loc})")
+            st.write(f"**Tu IP (Detectada):** {client_info.get('ip', 'N/A')} ({client_info.get('isp', 'N/A')})")
+            st.write(f"**Fecha/Hora Test:** {results_speed.get('timestamp', 'N/A')}") # Consider formatting this timestamp
+            st.markdown("**Evaluación General:**")
+            if download_mbps == 0 and upload_mbps == 0: st.error("🔴 No se obtuvieron resultados.")
+            else:
+                if download_mbps < 10: st.warning("Descarga baja (<10 Mbps).")
+                elif download_mbps < 50: st.info("Descarga moderada (10-50 Mbps).")
+                else: st.success("Descarga buena/excelente (≥50 Mbps).")
+                if upload_mbps < 2: st.warning("Subida baja (<2 Mbps).")
+                elif upload_mbps < 10: st.info("Subida moderada (2-10 Mbps).")
+                else: st.success("Subida buena/excelente (≥10 Mbps).")
+    else: st.info("ℹ️ Inicia un test de velocidad para ver resultados.")
+
+@st.cache_resource
+def registro_tiempos():
+    # Compartido por el proceso: la primera ejecución del script (normalmente el login) es el arranque en frío
+    return {"arranque_s": None}
+
+def registrar_ejecucion(duracion_s):
+    # Devuelve True solo para la primera ejecución del proceso
+    registro = registro_tiempos(); primera = registro["arranque_s"] is None
+    if primera: registro["arranque_s"] = duracion_s
+    obtener_instrumentacion().registrar("app.arranque" if primera else "app.ejecucion", duracion_s)
+    return primera
+
+def mostrar_tiempos(duracion_s, es_arranque):
+    registro = registro_tiempos(); instrumentacion = obtener_instrumentacion()
+    with st.sidebar:
+        texto = (f"⏱️ Ejecución: {duracion_s * 1000:.0f} ms (presupuesto {PRESUPUESTO_RERUN_MS} ms) · "
+                 f"Arranque: {registro['arranque_s']:.2f} s (presupuesto {PRESUPUESTO_ARRANQUE_S:g} s)")
+        if (duracion_s * 1000 > PRESUPUESTO_RERUN_MS and not es_arranque) or registro["arranque_s"] > PRESUPUESTO_ARRANQUE_S: st.warning(texto)
+        else: st.caption(texto)
+        with st.expander("🐞 Depuración: tiempos por etapa"):
+            # Todo el proceso (colector, anomalías, gráficos, almacén y pestañas), no solo esta sesión
+            tiempos_etapas = pd.DataFrame(instrumentacion.resumen())
+            if tiempos_etapas.empty: st.caption("Sin mediciones todavía.")
+            else: st.dataframe(tiempos_etapas.set_index("etapa").round(2), use_container_width=True)
 
 # --- Configuración de Página ---
 st.set_page_config(
@@ -118,12 +424,17 @@ st.set_page_config(
 # --- Cargar CSS Personalizado desde archivo ---
 load_css_from_file("style.css")
 
+# --- Colector de tráfico compartido (un único hilo por proceso), con historial persistente ---
+obtener_colector(obtener_almacen())
+
 # --- Inicializar estados ---
 if 'logged_in' not in st.session_state: st.session_state.logged_in = False
 if 'username' not in st.session_state: st.session_state.username = ""
 if 'ping_results' not in st.session_state: st.session_state.ping_results = None
 if 'monitor_results' not in st.session_state: st.session_state.monitor_results = None
 if 'speedtest_results' not in st.session_state: st.session_state.speedtest_results = None
+if 'speedtest_job' not in st.session_state: st.session_state.speedtest_job = None
+if 'speedtest_error' not in st.session_state: st.session_state.speedtest_error = None
 
 # --- Pantalla de Login ---
 if not st.session_state.logged_in:
@@ -139,7 +450,7 @@ if not st.session_state.logged_in:
         if submitted:
             if username_introducido in USUARIOS_VALIDOS and USUARIOS_VALIDOS[username_introducido] == password_introducida:
                 st.session_state.logged_in = True; st.session_state.username = username_introducido
-                for key in ['ping_results', 'monitor_results', 'speedtest_results']:
+                for key in ['ping_results', 'monitor_results', 'speedtest_results', 'speedtest_job', 'speedtest_error']:
                     if key in st.session_state: del st.session_state[key]
                 st.rerun()
             else: st.error("❌ Usuario o contraseña incorrectos.")
@@ -155,7 +466,7 @@ else:
         st.markdown('<hr class="custom-hr" style="margin: 1rem 0;">', unsafe_allow_html=True)
         if st.button("🚪 Cerrar Sesión", type="secondary"):
             st.session_state.logged_in = False; st.session_state.username = ""
-            for key in ['ping_results', 'monitor_results', 'speedtest_results']:
+            for key in ['ping_results', 'monitor_results', 'speedtest_results', 'speedtest_job', 'speedtest_error']:
                 if key in st.session_state: del st.session_state[key]
             st.rerun()
         st.markdown('<hr class="custom-hr" style="margin: 1rem 0;">', unsafe_allow_html=True)
@@ -169,145 +480,13 @@ else:
         "💨 Test Velocidad Internet"
     ])
 
-    # Pestaña 1: Monitor Local
-    with tab1:
-        st.subheader("Monitorizar Actividad de Red Local")
-        st.caption(f"Analiza la tasa de Bytes/s en tiempo real ({DURACION_MONITORIZACION_S} seg.) y detecta anomalías.")
-        if st.button(f"⏱️ Iniciar Monitorización Local", key="start_monitor_tab1"):
-            st.session_state.monitor_results = None
-            tasas_bps_lista = []
-            with st.status(f"Ejecutando monitorización local ({DURACION_MONITORIZACION_S}s)...", expanded=True) as status:
-                try:
-                    st.write("Obteniendo contadores iniciales...")
-                    last_counters = psutil.net_io_counters(); last_time = time.time()
-                    if not last_counters: raise Exception("No se pudieron obtener contadores iniciales.")
-                    progress_bar_monitor = st.progress(0, text="Iniciando...")
-                    for i in range(DURACION_MONITORIZACION_S):
-                        progress_text = f"Monitorizando segundo {i+1}/{DURACION_MONITORIZACION_S}..."; st.write(progress_text); time.sleep(1)
-                        current_counters = psutil.net_io_counters(); current_time = time.time()
-                        if not current_counters: tasas_bps_lista.append(np.nan); continue
-                        delta_time = current_time - last_time
-                        delta_bytes = (current_counters.bytes_sent + current_counters.bytes_recv) - (last_counters.bytes_sent + last_counters.bytes_recv)
-                        if delta_time > 0.1 and delta_bytes >= 0: tasas_bps_lista.append(delta_bytes / delta_time)
-                        else: tasas_bps_lista.append(0)
-                        last_counters = current_counters; last_time = current_time
-                        progress_bar_monitor.progress((i + 1) / DURACION_MONITORIZACION_S, text=progress_text)
-                    status.update(label="✔️ Monitorización Local Completada", state="complete", expanded=False)
-                    if tasas_bps_lista:
-                        serie_tasas_numeric = pd.to_numeric(np.array(tasas_bps_lista), errors='coerce')
-                        anomalias_indices = detectar_anomalias_serie(serie_tasas_numeric)
-                        st.session_state.monitor_results = {"serie_tasas": serie_tasas_numeric, "anomalias_indices": anomalias_indices}
-                    else: st.warning("⚠️ No se recogieron datos."); st.session_state.monitor_results = None
-                except Exception as e:
-                    status.update(label="❌ Error en Monitorización", state="error", expanded=True); st.error(f"Detalle: {e}")
-                    st.session_state.monitor_results = None
-
-        if st.session_state.monitor_results:
-            st.markdown('<hr class="custom-hr">', unsafe_allow_html=True)
-            st.subheader("Resultados del Monitor Local")
-            serie = st.session_state.monitor_results["serie_tasas"]; indices_anomalos = st.session_state.monitor_results["anomalias_indices"]
-            # Llamada a la función ya corregida
-            figura_plotly = crear_grafico_plotly_tasa(serie, indices_anomalos)
-            if figura_plotly: st.plotly_chart(figura_plotly, use_container_width=True)
-            else: st.warning("⚠️ No se pudo generar el gráfico.")
-
-            with st.expander("🔍 Ver Detalles de Anomalías Detectadas"):
-                indices_validos = [idx for idx in indices_anomalos if idx < len(serie)]
-                if len(indices_validos) > 0:
-                    st.write("**Segundos con actividad anómala y sugerencias:**")
-                    for idx in indices_validos:
-                        valor_tasa = serie[idx]
-                        if pd.notna(valor_tasa):
-                            solucion = sugerir_solucion_tasa(valor_tasa)
-                            col1_exp, col2_exp = st.columns([1, 3])
-                            with col1_exp:
-                                st.warning(f"Seg. *{idx+1}* ➡️ `{valor_tasa:,.0f}` B/s")
-                            with col2_exp:
-                                st.info(f"💡 {solucion}")
-                        else: # Manejo de NaN
-                            col1_exp, col2_exp = st.columns([1, 3])
-                            with col1_exp:
-                                st.warning(f"Seg. *{idx+1}* ➡️ `NaN`")
-                            with col2_exp:
-                                st.info("Valor no numérico.")
-                else:
-                    st.success("✅ No se detectaron anomalías significativas.")
-        else:
-            st.info("ℹ️ Inicia la monitorización para ver resultados.")
-
-
-    # Pestaña 2: Ping
-    with tab2:
-        st.subheader("Comprobación de Conexión (Ping)")
-        st.caption("Mide la latencia y estabilidad hacia un servidor específico.")
-        target_host_ping = st.text_input("🌐 Host o IP destino:", value="8.8.8.8", key="ping_target_tab2")
-        if st.button("🚀 Realizar Prueba de Ping", key="start_ping_tab2"):
-            st.session_state.ping_results = None
-            if target_host_ping:
-                with st.status(f"📡 Enviando pings a {target_host_ping}...", expanded=False) as status_ping:
-                    ping_result_data = realizar_ping(target_host_ping); st.session_state.ping_results = ping_result_data
-                    if ping_result_data: status_ping.update(label="✔️ Prueba Ping Completada", state="complete")
-                    else: status_ping.update(label="❌ Error en Prueba Ping", state="error")
-            else: st.warning("⚠️ Introduce un Host o IP.")
-        if st.session_state.ping_results:
-            st.markdown('<hr class="custom-hr">', unsafe_allow_html=True)
-            st.subheader("Resultados del Ping")
-            results_ping = st.session_state.ping_results
-            avg_ms = getattr(results_ping, 'rtt_avg_ms', float('inf')); max_ms = getattr(results_ping, 'rtt_max_ms', float('inf')); loss = getattr(results_ping, 'packet_loss', 1.0)
-            col_ping1, col_ping2, col_ping3 = st.columns(3)
-            with col_ping1: st.markdown(create_metric_card("Latencia Media ms", avg_ms, "⏱️", "ping-avg"), unsafe_allow_html=True)
-            with col_ping2: st.markdown(create_metric_card("Latencia Máxima ms", max_ms, "🐢", "ping-max"), unsafe_allow_html=True)
-            with col_ping3: st.markdown(create_metric_card("Paquetes Perdidos", loss, "💔", "ping-loss"), unsafe_allow_html=True)
-            with st.expander("💡 Ver Interpretación y Sugerencias del Ping"):
-                velocidad = "Indeterminada"; sugerencia_ping = "No hay sugerencias."
-                if loss > PERDIDA_PAQUETES_MAX_PERMITIDA:
-                    velocidad = f"🔴 FALLO (> {PERDIDA_PAQUETES_MAX_PERMITIDA:.0%})"; sugerencia_ping = "Pérdida alta: Problemas serios. Sug: Reinicia, verifica, contacta ISP."; st.error(f"**Estado:** {velocidad}"); st.info(f"**Sugerencia:** {sugerencia_ping}")
-                elif avg_ms == float('inf'):
-                    velocidad = f"❓ INALCANZABLE"; sugerencia_ping = "Host no responde. Verifica IP/conexión/firewall."; st.error(f"**Estado:** {velocidad}"); st.info(f"**Sugerencia:** {sugerencia_ping}")
-                elif avg_ms > LATENCIA_ACEPTABLE_MS:
-                    velocidad = f"🐌 LENTA (> {LATENCIA_ACEPTABLE_MS} ms)"; sugerencia_ping = f"Latencia alta: Congestión/server lento. Sug: Reinicia, cierra apps, contacta ISP."; st.warning(f"**Estado:** {velocidad}"); st.info(f"**Sugerencia:** {sugerencia_ping}")
-                elif avg_ms > LATENCIA_RAPIDA_MS:
-                    velocidad = f"👍 ACEPTABLE ({LATENCIA_RAPIDA_MS}-{LATENCIA_ACEPTABLE_MS} ms)"; sugerencia_ping = "Latencia normal."; st.success(f"**Estado:** {velocidad}"); st.info(f"**Sugerencia:** {sugerencia_ping}")
-                else:
-                    velocidad = f"🚀 RÁPIDA (≤ {LATENCIA_RAPIDA_MS} ms)"; sugerencia_ping = "Latencia excelente."; st.success(f"**Estado:** {velocidad}"); st.info(f"**Sugerencia:** {sugerencia_ping}")
-        else: st.info("ℹ️ Realiza una prueba de ping para ver resultados.")
-
-
-    # Pestaña 3: Speedtest
-    with tab3:
-        st.subheader("Test de Velocidad de Conexión a Internet")
-        st.caption("Mide tu velocidad real usando Speedtest.net (~30 seg).")
-        st.warning("⚠️ Necesitas `pip install speedtest-cli`.", icon="⚙️")
-        if st.button("💨 Iniciar Test de Velocidad", key="start_speedtest_tab3"):
-            st.session_state.speedtest_results = None
-            with st.status("⚙️ Ejecutando test de velocidad...", expanded=False) as status_speed:
-                speed_results_data = realizar_speedtest(); st.session_state.speedtest_results = speed_results_data
-                if speed_results_data: status_speed.update(label="✔️ Test de Velocidad Completado", state="complete")
-                else: status_speed.update(label="❌ Error en Test de Velocidad", state="error")
-        if st.session_state.speedtest_results:
-            st.markdown('<hr class="custom-hr">', unsafe_allow_html=True)
-            st.subheader("Resultados del Test de Velocidad")
-            results_speed = st.session_state.speedtest_results
-            download_mbps = results_speed.get('download', 0) / 1_000_000; upload_mbps = results_speed.get('upload', 0) / 1_000_000; ping_ms_speed = results_speed.get('ping', 0)
-            col_spd1, col_spd2, col_spd3 = st.columns(3)
-            with col_spd1: st.markdown(create_metric_card("Velocidad Descarga Mbps", download_mbps, "⬇️", "speed-dl"), unsafe_allow_html=True)
-            with col_spd2: st.markdown(create_metric_card("Velocidad Subida Mbps", upload_mbps, "⬆️", "speed-ul"), unsafe_allow_html=True)
-            with col_spd3: st.markdown(create_metric_card("Ping (Test Server) ms", ping_ms_speed, "↔️", "speed-ping"), unsafe_allow_html=True)
-            with st.expander("📄 Ver Detalles del Test y Evaluación"):
-                server_info = results_speed.get('server', {}); client_info = results_speed.get('client', {})
-                server_loc = server_info.get('location', 'N/A') + ", " + server_info.get('country', 'N/A')
-                st.write(f"**Servidor Test:** {server_info.get('name', 'N/A')} ({server_loc})")
-                st.write(f"**Tu IP (Detectada):** {client_info.get('ip', 'N/A')} ({client_info.get('isp', 'N/A')})")
-                st.write(f"**Fecha/Hora Test:** {results_speed.get('timestamp', 'N/A')}") # Consider formatting this timestamp
-                st.markdown("**Evaluación General:**")
-                if download_mbps == 0 and upload_mbps == 0: st.error("🔴 No se obtuvieron resultados.")
-                else:
-                    if download_mbps < 10: st.warning("Descarga baja (<10 Mbps).")
-                    elif download_mbps < 50: st.info("Descarga moderada (10-50 Mbps).")
-                    else: st.success("Descarga buena/excelente (≥50 Mbps).")
-                    if upload_mbps < 2: st.warning("Subida baja (<2 Mbps).")
-                    elif upload_mbps < 10: st.info("Subida moderada (2-10 Mbps).")
-                    else: st.success("Subida buena/excelente (≥10 Mbps).")
-        else: st.info("ℹ️ Inicia un test de velocidad para ver resultados.")
+    with tab1: pestana_monitor()
+    with tab2: pestana_ping()
+    with tab3: pestana_speedtest()
+
+# --- Tiempos: se registran en ambas ramas para que la primera ejecución (el login) cuente como arranque ---
+duracion_ejecucion_s = time.perf_counter() - _inicio_ejecucion
+es_arranque = registrar_ejecucion(duracion_ejecucion_s)
+if st.session_state.logged_in: mostrar_tiempos(duracion_ejecucion_s, es_arranque)
 
 # --- Fin del Script ---
\ No newline at end of file
@@ -0,0 +1,191 @@
+# agente.py - Modo agente sin interfaz: muestreo, sondeos y anomalías expuestos por HTTP
+# (formato texto de Prometheus en /metrics y JSON lines en /metrics.jsonl). No importa Streamlit.
+#
+# Uso: python agente.py --puerto 9108 --intervalo 0.1 --destinos 8.8.8.8,1.1.1.1
+
+import argparse
+import http.server
+import json
+import threading
+import time
+
+import numpy as np
+
+from anomalias import DetectorEWMA, MotorAnomalias
+from colector import ColectorTrafico
+from muestreo import METRICAS, tasa_total
+from sondeo import MODOS, PUERTO_TCP, expandir_destinos, sondear_destinos
+
+# --- Configuración ---
+PUERTO_AGENTE = 9108
+INTERVALO_INSTANTANEA_S = 1.0
+INTERVALO_SONDEO_S = 30.0
+PREFIJO = "monitor_red"
+# Métrica de psutil -> (nombre de la métrica exportada, dirección)
+METRICAS_EXPORTADAS = {
+    "bytes_sent": ("tasa_bytes", "enviados"), "bytes_recv": ("tasa_bytes", "recibidos"),
+    "packets_sent": ("tasa_paquetes", "enviados"), "packets_recv": ("tasa_paquetes", "recibidos"),
+    "errin": ("errores", "entrada"), "errout": ("errores", "salida"),
+    "dropin": ("descartes", "entrada"), "dropout": ("descartes", "salida"),
+}
+AYUDA = {
+    "tasa_bytes": "Bytes por segundo por interfaz y dirección (media del último intervalo)",
+    "tasa_paquetes": "Paquetes por segundo por interfaz y dirección",
+    "errores": "Errores por segundo por interfaz y dirección",
+    "descartes": "Paquetes descartados por segundo por interfaz y dirección",
+}
+
+
+def _etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _numero(valor):
+    return "NaN" if valor is None or not np.isfinite(valor) else repr(float(valor))
+
+
+class Agente:
+    def __init__(self, intervalo_s=1.0, destinos=(), modo_sondeo="auto", puerto_tcp=PUERTO_TCP,
+                 intervalo_instantanea_s=INTERVALO_INSTANTANEA_S, intervalo_sondeo_s=INTERVALO_SONDEO_S, almacen=None):
+        self.colector = ColectorTrafico(intervalo_s=intervalo_s, capacidad=max(3600, int(600 / intervalo_s)), almacen=almacen)
+        self.motor = MotorAnomalias()   # Modelo cacheado sobre la media de cada instantánea
+        self.rapido = DetectorEWMA()     # Detector por muestra, a la frecuencia del colector
+        self.destinos = list(destinos); self.modo_sondeo = modo_sondeo; self.puerto_tcp = puerto_tcp
+        self.intervalo_instantanea_s = intervalo_instantanea_s; self.intervalo_sondeo_s = intervalo_sondeo_s
+        self.sondeos = {}   # destino -> último resultado
+        self.anomalias_total = {"ewma": 0, "isolation_forest": 0}
+        # Instantánea ya codificada; los manejadores HTTP solo leen esta referencia (sin bloqueos ni cálculo)
+        self.instantanea = (b"", b"")
+        self._leidos = 0
+        self._parar = threading.Event()
+
+    # --- Hilos ---
+    def iniciar(self):
+        self.colector.iniciar()
+        threading.Thread(target=self._bucle_instantanea, name="agente-instantanea", daemon=True).start()
+        if self.destinos: threading.Thread(target=self._bucle_sondeo, name="agente-sondeo", daemon=True).start()
+        return self
+
+    def detener(self):
+        self._parar.set(); self.colector.detener(timeout=2)
+
+    def _bucle_sondeo(self):
+        while not self._parar.is_set():
+            for resultado in sondear_destinos(self.destinos, modo=self.modo_sondeo, puerto=self.puerto_tcp):
+                self.sondeos[resultado["host"]] = resultado
+            self._parar.wait(self.intervalo_sondeo_s)
+
+    def _bucle_instantanea(self):
+        while not self._parar.wait(self.intervalo_instantanea_s):
+            try: self.instantanea = self.construir_instantanea()
+            except Exception as e: print(f"Error al construir la instantánea: {e}")
+
+    # --- Instantánea ---
+    def construir_instantanea(self):
+        # Los detectores solo procesan las muestras nuevas desde la instantánea anterior; el colector nunca espera por esto
+        tiempos, tasas, self._leidos = self.colector.buffer.desde(self._leidos)
+        ahora = time.time()
+        # Los gauges salen de la última ventana (al menos una muestra), no de las nuevas: con un intervalo de muestreo
+        # mayor que el de la instantánea, o con los dos bucles desfasados, no quedan huecos NaN entre raspados
+        _, recientes = self.colector.ventana_interfaces(max(self.colector.intervalo_s, self.intervalo_instantanea_s))
+        medias = np.full((len(self.colector.interfaces), len(METRICAS)), np.nan)
+        if len(recientes) > 0:
+            with np.errstate(all="ignore"): medias = np.nanmean(recientes, axis=0)
+        anomalia_ewma = anomalia_if = False
+        if len(tiempos) > 0:
+            totales = tasa_total(tasas)
+            anomalia_ewma = bool(self.rapido.actualizar_lote(totales).any())
+            if np.isfinite(totales).any():
+                anomalia_if = len(self.motor.procesar(tiempos[-1:], [np.nanmean(totales)])) > 0
+            self.anomalias_total["ewma"] += anomalia_ewma; self.anomalias_total["isolation_forest"] += anomalia_if
+        total = float(tasa_total(medias)) if len(recientes) > 0 else np.nan
+        return self._prometheus(ahora, medias, total, anomalia_ewma, anomalia_if), self._jsonl(ahora, medias, total, anomalia_ewma, anomalia_if)
+
+    def _prometheus(self, ahora, medias, total, anomalia_ewma, anomalia_if):
+        lineas = []
+        por_nombre = {}
+        for j, metrica in enumerate(METRICAS):
+            nombre, direccion = METRICAS_EXPORTADAS[metrica]
+            for i, interfaz in enumerate(self.colector.interfaces):
+                por_nombre.setdefault(nombre, []).append(f'{PREFIJO}_{nombre}{{interfaz="{_etiqueta(interfaz)}",direccion="{direccion}"}} {_numero(medias[i, j])}')
+        for nombre, muestras in por_nombre.items():
+            lineas += [f"# HELP {PREFIJO}_{nombre} {AYUDA[nombre]}", f"# TYPE {PREFIJO}_{nombre} gauge", *muestras]
+        lineas += [f"# HELP {PREFIJO}_tasa_total_bytes Bytes por segundo enviados + recibidos en todas las interfaces",
+                   f"# TYPE {PREFIJO}_tasa_total_bytes gauge", f"{PREFIJO}_tasa_total_bytes {_numero(total)}",
+                   f"# HELP {PREFIJO}_anomalia 1 si hubo alguna anomalía en el último intervalo",
+                   f"# TYPE {PREFIJO}_anomalia gauge",
+                   f'{PREFIJO}_anomalia{{detector="ewma"}} {int(anomalia_ewma)}',
+                   f'{PREFIJO}_anomalia{{detector="isolation_forest"}} {int(anomalia_if)}',
+                   f"# HELP {PREFIJO}_anomalias_total Intervalos con anomalía desde el arranque",
+                   f"# TYPE {PREFIJO}_anomalias_total counter",
+                   *(f'{PREFIJO}_anomalias_total{{detector="{d}"}} {n}' for d, n in self.anomalias_total.items())]
+        sondeos = [r for r in list(self.sondeos.values()) if "error" not in r]
+        if sondeos:
+            lineas += [f"# HELP {PREFIJO}_sondeo_rtt_ms Latencia por destino y cuantil", f"# TYPE {PREFIJO}_sondeo_rtt_ms gauge"]
+            for r in sondeos:
+                for cuantil, clave in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+                    lineas.append(f'{PREFIJO}_sondeo_rtt_ms{{destino="{_etiqueta(r["host"])}",modo="{r["modo"]}",cuantil="{cuantil}"}} {_numero(r[clave])}')
+            lineas += [f"# HELP {PREFIJO}_sondeo_jitter_ms Jitter por destino", f"# TYPE {PREFIJO}_sondeo_jitter_ms gauge"]
+            lineas += [f'{PREFIJO}_sondeo_jitter_ms{{destino="{_etiqueta(r["host"])}"}} {_numero(r["jitter_ms"])}' for r in sondeos]
+            lineas += [f"# HELP {PREFIJO}_sondeo_perdida Fracción de paquetes perdidos por destino", f"# TYPE {PREFIJO}_sondeo_perdida gauge"]
+            lineas += [f'{PREFIJO}_sondeo_perdida{{destino="{_etiqueta(r["host"])}"}} {_numero(r["perdida"])}' for r in sondeos]
+        lineas += [f"# HELP {PREFIJO}_instantanea_timestamp_seconds Momento en que se generó esta instantánea",
+                   f"# TYPE {PREFIJO}_instantanea_timestamp_seconds gauge", f"{PREFIJO}_instantanea_timestamp_seconds {ahora:.3f}"]
+        return ("\n".join(lineas) + "\n").encode()
+
+    def _jsonl(self, ahora, medias, total, anomalia_ewma, anomalia_if):
+        limpiar = lambda v: None if v is None or not np.isfinite(v) else float(v)
+        registros = [{"tipo": "interfaz", "t": ahora, "interfaz": interfaz, **{m: limpiar(medias[i, j]) for j, m in enumerate(METRICAS)}}
+                     for i, interfaz in enumerate(self.colector.interfaces)]
+        registros.append({"tipo": "total", "t": ahora, "tasa_bps": limpiar(total)})
+        registros.append({"tipo": "anomalia", "t": ahora, "ewma": anomalia_ewma, "isolation_forest": anomalia_if, "totales": dict(self.anomalias_total)})
+        for r in list(self.sondeos.values()):
+            registros.append({"tipo": "sondeo", "t": ahora, **{k: (limpiar(v) if isinstance(v, float) else v) for k, v in r.items() if k != "rtts_ms"}})
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in registros).encode()
+
+
+def crear_servidor(agente, direccion="127.0.0.1", puerto=PUERTO_AGENTE):
+    class Manejador(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            prometheus, jsonl = agente.instantanea
+            if self.path == "/metrics": cuerpo, tipo = prometheus, "text/plain; version=0.0.4; charset=utf-8"
+            elif self.path == "/metrics.jsonl": cuerpo, tipo = jsonl, "application/x-ndjson"
+            else: self.send_error(404); return
+            self.send_response(200); self.send_header("Content-Type", tipo); self.send_header("Content-Length", str(len(cuerpo))); self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args): pass
+
+    servidor = http.server.ThreadingHTTPServer((direccion, puerto), Manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agente de monitorización de red sin interfaz (exportador Prometheus / JSON lines).")
+    parser.add_argument("--direccion", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=PUERTO_AGENTE)
+    parser.add_argument("--intervalo", type=float, default=1.0, help="Intervalo de muestreo en segundos (admite p.ej. 0.1)")
+    parser.add_argument("--destinos", default="", help="Hosts, IPs o rangos CIDR a sondear, separados por comas")
+    parser.add_argument("--modo-sondeo", choices=MODOS, default="auto")
+    parser.add_argument("--puerto-tcp", type=int, default=PUERTO_TCP)
+    parser.add_argument("--cada-sondeo", type=float, default=INTERVALO_SONDEO_S)
+    parser.add_argument("--historial", default=None, help="Directorio del historial en disco (por defecto no se guarda)")
+    args = parser.parse_args()
+
+    almacen = None
+    if args.historial:
+        from almacen import AlmacenSeries
+        almacen = AlmacenSeries(args.historial).iniciar()
+    agente = Agente(intervalo_s=args.intervalo, destinos=expandir_destinos(args.destinos) if args.destinos else (),
+                    modo_sondeo=args.modo_sondeo, puerto_tcp=args.puerto_tcp, intervalo_sondeo_s=args.cada_sondeo, almacen=almacen).iniciar()
+    servidor = crear_servidor(agente, args.direccion, args.puerto)
+    print(f"Agente escuchando en http://{args.direccion}:{servidor.server_address[1]}/metrics (y /metrics.jsonl)")
+    try: servidor.serve_forever()
+    except KeyboardInterrupt: pass
+    finally:
+        servidor.server_close(); agente.detener()
+        if almacen is not None: almacen.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# almacen.py - Almacén persistente de series temporales (Parquet por segmentos, con agregados 1 s / 1 min / 1 h)
+
+import atexit
+import os
+import threading
+import time
+import uuid
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from instrumentacion import medida
+
+# --- Configuración ---
+DIRECTORIO_HISTORIAL = "historial"
+TAMANO_LOTE = 5000             # Filas pendientes que fuerzan un volcado
+INTERVALO_VOLCADO_S = 30
+NIVELES = {"1s": 1, "1min": 60, "1h": 3600}
+ESTADISTICAS = ("min", "max", "media", "p95", "n")
+SEGUNDOS_HORA = 3600
+SEGUNDOS_DIA = 86400
+
+
+def _agregar_por_cubo(df, segundos, desde_agregados=False):
+    # Agrega filas por cubos de 'segundos'. Desde datos crudos el p95 es exacto; desde agregados de 1 s
+    # min/max/media se combinan exactamente y el p95 se calcula sobre las medias por segundo.
+    cubos = (df["t"] // segundos) * segundos
+    grupos = df.drop(columns="t").groupby(cubos.values, sort=True)
+    salida = {}
+    if not desde_agregados:
+        for col in df.columns.drop("t"):
+            g = grupos[col]
+            salida.update({f"{col}_min": g.min(), f"{col}_max": g.max(), f"{col}_media": g.mean(),
+                           f"{col}_p95": g.quantile(0.95), f"{col}_n": g.count()})
+    else:
+        bases = sorted({c.rsplit("_", 1)[0] for c in df.columns if c != "t"})
+        for col in bases:
+            suma = (df[f"{col}_media"].fillna(0) * df[f"{col}_n"]).groupby(cubos.values).sum()
+            n = grupos[f"{col}_n"].sum()
+            salida.update({f"{col}_min": grupos[f"{col}_min"].min(), f"{col}_max": grupos[f"{col}_max"].max(),
+                           f"{col}_media": (suma / n.where(n > 0)), f"{col}_p95": grupos[f"{col}_media"].quantile(0.95), f"{col}_n": n})
+    resultado = pd.DataFrame(salida)
+    resultado.insert(0, "t", resultado.index.astype(float))
+    return resultado.reset_index(drop=True)
+
+
+def _combinar_duplicados(df):
+    # Cubos partidos entre dos segmentos (p.ej. al cerrar el proceso): combinación exacta salvo el p95 (se toma el mayor)
+    if df.empty or not df["t"].duplicated().any(): return df
+    bases = sorted({c.rsplit("_", 1)[0] for c in df.columns if c != "t"})
+    grupos = df.groupby("t", sort=True); salida = {}
+    for col in bases:
+        if f"{col}_n" in df:
+            n = grupos[f"{col}_n"].sum()
+            salida[f"{col}_media"] = (df[f"{col}_media"].fillna(0) * df[f"{col}_n"]).groupby(df["t"]).sum() / n.where(n > 0)
+            salida[f"{col}_n"] = n
+        for est, func in (("min", "min"), ("max", "max"), ("p95", "max")):
+            if f"{col}_{est}" in df: salida[f"{col}_{est}"] = grupos[f"{col}_{est}"].agg(func)
+    resultado = pd.DataFrame(salida)
+    resultado.insert(0, "t", resultado.index.astype(float))
+    return resultado.reset_index(drop=True)[df.columns]
+
+
+def _parquet():
+    # pandas ya carga pyarrow, pero no pyarrow.parquet: se importa en el primer volcado o consulta, no al arrancar la app
+    import pyarrow.parquet as pq
+    return pq
+
+
+def _nombre_segmento(t0, t1):
+    # Rango en ms más un sufijo único: un cubo reemitido tras reiniciar el proceso nunca sobrescribe el anterior
+    # (las consultas de niveles agregados fusionan ambos con _combinar_duplicados)
+    return f"{int(t0 * 1000)}-{int(t1 * 1000)}-{uuid.uuid4().hex[:12]}.parquet"
+
+
+class _SeriePendiente:
+    def __init__(self):
+        self.crudo = []            # Lotes de filas crudas aún no escritas
+        self.filas = 0
+        # Agregados de 1 s aún no incluidos en cada nivel (base de 1 min y 1 h)
+        self.segundos = {"1min": None, "1h": None}
+
+
+class AlmacenSeries:
+    def __init__(self, directorio=DIRECTORIO_HISTORIAL, tamano_lote=TAMANO_LOTE, intervalo_volcado_s=INTERVALO_VOLCADO_S):
+        self.directorio = directorio; self.tamano_lote = tamano_lote; self.intervalo_volcado_s = intervalo_volcado_s
+        self._pendientes = {}
+        self._lock = threading.Lock()        # Protege los datos pendientes (escrituras rápidas en memoria)
+        self._lock_disco = threading.Lock()  # Serializa volcados y compactaciones
+        self._parar = threading.Event(); self._despertar = threading.Event(); self._hilo = None
+
+    # --- Escritura ---
+    def agregar(self, serie, tiempos, **columnas):
+        lote = pd.DataFrame({"t": np.asarray(tiempos, dtype=float), **{k: np.asarray(v, dtype=float) for k, v in columnas.items()}})
+        with self._lock:
+            pendiente = self._pendientes.setdefault(serie, _SeriePendiente())
+            pendiente.crudo.append(lote); pendiente.filas += len(lote)
+            lleno = pendiente.filas >= self.tamano_lote
+        if lleno:
+            # Con el hilo de volcado activo, quien agrega (p.ej. el colector) nunca espera a la escritura en disco
+            if self._hilo is not None and self._hilo.is_alive(): self._despertar.set()
+            else: self.volcar()
+
+    def agregar_registro(self, serie, tiempo, **valores):
+        self.agregar(serie, [tiempo], **{k: [np.nan if v is None else v] for k, v in valores.items()})
+
+    @medida("almacen.volcado")
+    def volcar(self, cerrar_cubos=False):
+        # Escribe los datos crudos y los agregados de cubos ya cerrados; 'cerrar_cubos' fuerza también los abiertos
+        with self._lock_disco:
+            with self._lock:
+                trabajo = {serie: p.crudo for serie, p in self._pendientes.items() if p.crudo or cerrar_cubos}
+                for serie in trabajo: self._pendientes[serie].crudo = []; self._pendientes[serie].filas = 0
+            for serie, lotes in trabajo.items():
+                crudo = pd.concat(lotes, ignore_index=True).sort_values("t", kind="stable") if lotes else None
+                self._volcar_serie(serie, crudo, cerrar_cubos)
+
+    def _volcar_serie(self, serie, crudo, cerrar_cubos):
+        pendiente = self._pendientes[serie]
+        if crudo is not None and not crudo.empty:
+            self._escribir(serie, "raw", crudo)
+            segundos = _agregar_por_cubo(crudo, NIVELES["1s"])
+            self._escribir(serie, "1s", segundos)
+            for nivel, previos in pendiente.segundos.items():
+                pendiente.segundos[nivel] = segundos if previos is None else pd.concat([previos, segundos], ignore_index=True)
+        limite = np.inf if cerrar_cubos else time.time()
+        for nivel, previos in pendiente.segundos.items():
+            if previos is None or previos.empty: continue
+            ancho = NIVELES[nivel]
+            listos = (previos["t"] // ancho) * ancho + ancho <= limite
+            if listos.any():
+                # Los segundos que llegan tarde a un cubo ya escrito salen como cubo parcial en el siguiente volcado;
+                # las consultas fusionan las partes con _combinar_duplicados
+                self._escribir(serie, nivel, _agregar_por_cubo(previos[listos], ancho, desde_agregados=True))
+                pendiente.segundos[nivel] = previos[~listos].reset_index(drop=True)
+
+    def _ruta(self, serie, nivel):
+        return os.path.join(self.directorio, quote(serie, safe=""), nivel)
+
+    def _escribir(self, serie, nivel, df):
+        if df.empty: return
+        ruta = self._ruta(serie, nivel); os.makedirs(ruta, exist_ok=True)
+        nombre = _nombre_segmento(df['t'].iloc[0], df['t'].iloc[-1])
+        tabla = pa.Table.from_pandas(df, preserve_index=False); pq = _parquet()
+        temporal = os.path.join(ruta, f".{nombre}.tmp")
+        pq.write_table(tabla, temporal, compression="zstd")
+        os.replace(temporal, os.path.join(ruta, nombre))
+        self._compactar(ruta)
+
+    # --- Segmentos ---
+    @staticmethod
+    def _segmentos(ruta):
+        if not os.path.isdir(ruta): return []
+        segmentos = []
+        for nombre in os.listdir(ruta):
+            if not nombre.endswith(".parquet"): continue
+            # Solo el rango: el sufijo único (ausente en segmentos antiguos) no se interpreta
+            t0, t1 = nombre[:-len(".parquet")].split("-")[:2]
+            segmentos.append((int(t0) / 1000, int(t1) / 1000, os.path.join(ruta, nombre)))
+        return sorted(segmentos)
+
+    def _compactar(self, ruta):
+        # Los lotes de cada hora cerrada se fusionan en un segmento, y las horas de cada día cerrado en uno diario.
+        # Así el número de ficheros que lee una consulta crece con los días, no con los volcados.
+        ahora = time.time(); grupos = {}; pq = _parquet()
+        for seg in self._segmentos(ruta):
+            dia = int(seg[0] // SEGUNDOS_DIA)
+            if (dia + 1) * SEGUNDOS_DIA <= ahora: clave = (dia * SEGUNDOS_DIA, SEGUNDOS_DIA)
+            else: clave = (int(seg[0] // SEGUNDOS_HORA) * SEGUNDOS_HORA, SEGUNDOS_HORA)
+            grupos.setdefault(clave, []).append(seg)
+        for (inicio, ancho), segmentos in grupos.items():
+            if len(segmentos) < 2 or inicio + ancho > ahora: continue
+            tabla = pa.concat_tables([pq.read_table(s[2]) for s in segmentos], promote_options="default").sort_by("t")
+            t = tabla.column("t")
+            nombre = _nombre_segmento(t[0].as_py(), t[-1].as_py())
+            temporal = os.path.join(ruta, f".{nombre}.tmp")
+            pq.write_table(tabla, temporal, compression="zstd", row_group_size=65536)
+            # Primero el segmento fusionado (nombre único) y después se borran los originales: un fallo entre
+            # ambos pasos deja filas duplicadas, que las consultas agregadas combinan, en vez de perder la hora o el día
+            os.replace(temporal, os.path.join(ruta, nombre))
+            for s in segmentos: os.remove(s[2])
+
+    # --- Consulta ---
+    def series(self):
+        if not os.path.isdir(self.directorio): return []
+        return sorted(unquote(d) for d in os.listdir(self.directorio) if os.path.isdir(os.path.join(self.directorio, d)))
+
+    @medida("almacen.consulta")
+    def consultar(self, serie, desde, hasta, columnas=None, nivel="raw"):
+        # Lee solo los segmentos que solapan [desde, hasta] y solo las columnas pedidas.
+        # En niveles agregados 'columnas' son los nombres base (p.ej. 'tasa_bps' -> tasa_bps_min, _max, ...)
+        if nivel != "raw" and nivel not in NIVELES: raise ValueError(f"Nivel no válido: {nivel}")
+        pq = _parquet()
+        with self._lock_disco:
+            segmentos = [s for s in self._segmentos(self._ruta(serie, nivel)) if s[1] >= desde and s[0] <= hasta]
+            if columnas is not None:
+                columnas = list(columnas) if nivel == "raw" else [f"{c}_{e}" for c in columnas for e in ESTADISTICAS]
+                columnas = ["t"] + columnas
+            filtro = [("t", ">=", float(desde)), ("t", "<=", float(hasta))]
+            tablas = [pq.read_table(s[2], columns=columnas, filters=filtro) for s in segmentos]
+        if not tablas: return pd.DataFrame(columns=columnas or ["t"])
+        df = pa.concat_tables(tablas, promote_options="default").to_pandas().sort_values("t", kind="stable").reset_index(drop=True)
+        return df if nivel == "raw" else _combinar_duplicados(df)
+
+    # --- Volcado periódico en segundo plano ---
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._parar.clear()
+            self._hilo = threading.Thread(target=self._bucle, name="almacen-volcado", daemon=True); self._hilo.start()
+        return self
+
+    def cerrar(self):
+        self._parar.set(); self._despertar.set()
+        self.volcar(cerrar_cubos=True)
+
+    def _bucle(self):
+        while True:
+            self._despertar.wait(self.intervalo_volcado_s); self._despertar.clear()
+            if self._parar.is_set(): return
+            try: self.volcar()
+            except Exception: pass  # Un fallo de disco no debe detener el volcado siguiente
+
+
+# --- Instancia única por proceso ---
+_almacen = None
+_almacen_lock = threading.Lock()
+
+def obtener_almacen():
+    global _almacen
+    with _almacen_lock:
+        if _almacen is None:
+            _almacen = AlmacenSeries().iniciar()
+            atexit.register(_almacen.cerrar)
+        return _almacen
@@ -0,0 +1,257 @@
+# anomalias.py - Motor de anomalías con estado entre llamadas (ajuste cacheado + detector por muestra)
+
+import threading
+
+import numpy as np
+
+from colector import BufferCircular
+from instrumentacion import medida
+from muestreo import COLUMNAS_BYTES, METRICAS
+
+# --- Configuración ---
+CONTAMINACION_ESPERADA = 'auto'
+ESTADO_ALEATORIO = 42
+CAPACIDAD_LINEA_BASE = 600   # Muestras de la línea base móvil (acota el coste del ajuste)
+MINIMO_AJUSTE = 30           # Por debajo de esto se reajusta en cada llamada hasta llenar la base
+REAJUSTE_CADA = 300          # Reajuste programado cada N muestras nuevas
+VENTANA_DERIVA = 60          # Muestras recientes comparadas con la base del último ajuste
+UMBRAL_DERIVA = 3.0          # Desplazamiento de la mediana (en MADs) que invalida el modelo
+MAD_A_SIGMA = 1.4826
+VENTANA_MOVIL = 30           # Muestras previas de la media/desviación móvil en el modo multivariante
+UMBRAL_Z_MULTIVARIANTE = 6.0 # z robusto (mediana/MAD) a partir del cual una característica es anómala
+PISO_DESVIACION_MOVIL = 1024.0  # B/s sumados a la desviación móvil (tráfico casi constante no dispara el desvío)
+CARACTERISTICAS = METRICAS + ("delta_bytes_sent", "delta_bytes_recv", "desvio_movil_bytes")
+# Escala mínima por característica: evita z infinitos en contadores casi siempre a cero (errores, descartes)
+PISO_ESCALA = np.array([1024.0, 1024.0, 10.0, 10.0, 1.0, 1.0, 1.0, 1.0, 1024.0, 1024.0, 1.0])
+SOLO_AUMENTOS = np.isin(CARACTERISTICAS, ("delta_bytes_sent", "delta_bytes_recv"))
+
+
+# --- Detector rápido por muestra: EWMA de media y varianza, coste O(1) ---
+class DetectorEWMA:
+    def __init__(self, alfa=0.1, umbral_z=4.0, calentamiento=10):
+        self.alfa = alfa; self.umbral_z = umbral_z; self.calentamiento = calentamiento
+        self.media = None; self.varianza = 0.0; self.vistos = 0
+
+    def actualizar(self, valor):
+        if not np.isfinite(valor): return False
+        if self.media is None:
+            self.media = float(valor); self.vistos = 1; return False
+        desv = np.sqrt(self.varianza)
+        anomalo = self.vistos >= self.calentamiento and desv > 0 and abs(valor - self.media) > self.umbral_z * desv
+        # Los valores anómalos se recortan antes de actualizar para no contaminar la referencia
+        if anomalo: valor = self.media + np.sign(valor - self.media) * self.umbral_z * desv
+        diferencia = valor - self.media
+        self.media += self.alfa * diferencia
+        self.varianza = (1 - self.alfa) * (self.varianza + self.alfa * diferencia * diferencia)
+        self.vistos += 1
+        return bool(anomalo)
+
+    def actualizar_lote(self, valores):
+        return np.fromiter((self.actualizar(v) for v in valores), dtype=bool, count=len(valores))
+
+
+# --- Motor con modelo cacheado sobre una línea base móvil ---
+class MotorAnomalias:
+    def __init__(self, capacidad_base=CAPACIDAD_LINEA_BASE, minimo_ajuste=MINIMO_AJUSTE, reajuste_cada=REAJUSTE_CADA,
+                 ventana_deriva=VENTANA_DERIVA, umbral_deriva=UMBRAL_DERIVA):
+        self.base = BufferCircular(capacidad_base)
+        self.minimo_ajuste = minimo_ajuste; self.reajuste_cada = reajuste_cada
+        self.ventana_deriva = ventana_deriva; self.umbral_deriva = umbral_deriva
+        self.rapido = DetectorEWMA()
+        self.modelo = None; self.ajustes = 0
+        self._n_ajuste = 0; self._nuevas = 0; self._mediana_ajuste = np.nan; self._escala_ajuste = np.nan
+        self._ultimo_t = -np.inf
+        self._lock = threading.Lock()
+
+    def observar(self, tiempos, valores):
+        with self._lock: return self._observar(tiempos, valores)
+
+    def _observar(self, tiempos, valores):
+        # Añade a la base solo las muestras no vistas (por marca de tiempo); devuelve los avisos EWMA de esas muestras
+        tiempos = np.asarray(tiempos, dtype=float); valores = np.asarray(valores, dtype=float)
+        nuevas = tiempos > self._ultimo_t
+        if not nuevas.any(): return np.zeros(len(valores), dtype=bool)
+        avisos = np.zeros(len(valores), dtype=bool)
+        avisos[nuevas] = self.rapido.actualizar_lote(valores[nuevas])
+        for t, v in zip(tiempos[nuevas], valores[nuevas]):
+            if np.isfinite(v): self.base.agregar(t, v); self._nuevas += 1
+        self._ultimo_t = tiempos[nuevas].max()
+        return avisos
+
+    def _deriva(self):
+        _, recientes = self.base.ventana(self.ventana_deriva)
+        if len(recientes) == 0 or not np.isfinite(self._escala_ajuste): return False
+        return abs(np.median(recientes) - self._mediana_ajuste) > self.umbral_deriva * self._escala_ajuste
+
+    def _necesita_ajuste(self):
+        if self.modelo is None: return True
+        if self._n_ajuste < self.minimo_ajuste and len(self.base) > self._n_ajuste: return True
+        if self._deriva():
+            # Cambio de régimen: la base antigua ya no es representativa, se reinicia con las muestras recientes
+            tiempos, recientes = self.base.ventana(self.ventana_deriva)
+            self.base = BufferCircular(self.base.capacidad)
+            for t, v in zip(tiempos, recientes): self.base.agregar(t, v)
+            return True
+        return self._nuevas >= self.reajuste_cada
+
+    @medida("anomalias.ajuste")
+    def _ajustar(self):
+        _, X = self.base.ventana()
+        if len(X) < 5: self.modelo = None; return
+        # sklearn tarda ~0.7 s en importarse: se carga la primera vez que hace falta un ajuste, no al arrancar
+        from sklearn.ensemble import IsolationForest
+        self.modelo = IsolationForest(contamination=CONTAMINACION_ESPERADA, random_state=ESTADO_ALEATORIO).fit(X.reshape(-1, 1))
+        mediana = np.median(X)
+        self._mediana_ajuste = mediana
+        self._escala_ajuste = max(MAD_A_SIGMA * np.median(np.abs(X - mediana)), 1e-9 * max(abs(mediana), 1.0))
+        self._n_ajuste = len(X); self._nuevas = 0; self.ajustes += 1
+
+    def puntuar(self, valores):
+        # Índices anómalos del lote con el modelo cacheado; los NaN nunca se marcan
+        valores = np.asarray(valores, dtype=float)
+        finitos = np.isfinite(valores)
+        if self.modelo is None or not finitos.any(): return np.array([], dtype=int)
+        predicciones = np.ones(len(valores), dtype=int)
+        predicciones[finitos] = self.modelo.predict(valores[finitos].reshape(-1, 1))
+        return np.where(predicciones == -1)[0]
+
+    @medida("anomalias.procesar")
+    def procesar(self, tiempos, valores):
+        with self._lock:
+            self._observar(tiempos, valores)
+            if self._necesita_ajuste(): self._ajustar()
+            return self.puntuar(valores)
+
+
+def detectar_anomalias(valores, tiempos=None, motor=None):
+    # Índices anómalos de una serie de tasa; sin tiempos se numeran las muestras. Lanza las excepciones del modelo.
+    if valores is None or len(valores) < 5: return np.array([], dtype=int)
+    valores = np.asarray(valores, dtype=float)
+    if tiempos is None: tiempos = np.arange(len(valores), dtype=float)
+    return (motor or obtener_motor()).procesar(tiempos, valores)
+
+
+# --- Modo multivariante: todas las interfaces y métricas en una sola pasada vectorizada ---
+def mediana_nan(x):
+    # Mediana por columnas (eje 0) ignorando NaN: una ordenación y un índice por columna.
+    # np.nanmedian recorre columna a columna cuando hay NaN y es ~10 veces más lento con decenas de interfaces.
+    ordenado = np.sort(x, axis=0)   # Los NaN quedan al final
+    n = np.isfinite(x).sum(axis=0)
+    bajo = np.take_along_axis(ordenado, np.maximum((n - 1) // 2, 0)[None], axis=0)[0]
+    alto = np.take_along_axis(ordenado, np.maximum(n // 2, 0)[None], axis=0)[0]
+    return np.where(n > 0, (bajo + alto) / 2, np.nan)
+
+
+def _media_desv_previas(x, ventana):
+    # Media y desviación de las 'ventana' muestras anteriores a cada una (eje 0), con sumas acumuladas; los NaN no cuentan
+    finitos = np.isfinite(x)
+    # Centrar en la media global reduce la cancelación al restar sumas de cuadrados
+    centro = np.where(finitos, x, 0.0).sum(axis=0) / np.maximum(finitos.sum(axis=0), 1)
+    x0 = np.where(finitos, x - centro, 0.0)
+    ceros = np.zeros((1,) + x.shape[1:])
+    suma = np.concatenate([ceros, np.cumsum(x0, axis=0)]); suma2 = np.concatenate([ceros, np.cumsum(x0 * x0, axis=0)])
+    cuenta = np.concatenate([ceros, np.cumsum(finitos, axis=0)])
+    fin = np.arange(len(x)); ini = np.maximum(0, fin - ventana)
+    n = cuenta[fin] - cuenta[ini]
+    n = np.where(n >= max(2, ventana // 3), n, np.nan)   # Con muy pocas muestras previas la desviación no es fiable
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = (suma[fin] - suma[ini]) / n
+        varianza = np.maximum((suma2[fin] - suma2[ini]) / n - media * media, 0.0)
+    return media + centro, np.sqrt(varianza)
+
+
+def construir_caracteristicas(tasas, ventana=VENTANA_MOVIL):
+    # (muestras, interfaces, métricas) -> (muestras, interfaces, características), en el orden de CARACTERISTICAS
+    tasas = np.asarray(tasas, dtype=float)
+    bytes_dir = tasas[..., list(COLUMNAS_BYTES)]
+    deltas = np.concatenate([np.full((1,) + bytes_dir.shape[1:], np.nan), np.diff(bytes_dir, axis=0)])
+    # Desvío de los bytes totales respecto a la media/desviación móviles previas: salta en la muestra del pico y no después
+    total = bytes_dir.sum(axis=-1)
+    media, desv = _media_desv_previas(total, ventana)
+    desvio_local = (total - media) / (desv + PISO_DESVIACION_MOVIL)
+    return np.concatenate([tasas, deltas, desvio_local[..., None]], axis=-1)
+
+
+def referencia_robusta(X):
+    # Mediana y escala (MAD en sigmas, con suelo por característica) de cada interfaz y característica
+    mediana = mediana_nan(X)
+    return mediana, np.fmax(MAD_A_SIGMA * mediana_nan(np.abs(X - mediana)), PISO_ESCALA)
+
+
+def puntuar_multivariante(X, mediana, escala, interfaces=None, umbral_z=UMBRAL_Z_MULTIVARIANTE, maximo_causas=3):
+    # z robusto de todas las interfaces y características a la vez. Los NaN se imputan a la mediana de referencia
+    # (z = 0) sin descartar filas. Devuelve los índices anómalos, la matriz z y las causas de cada muestra anómala.
+    z = np.nan_to_num((X - mediana) / escala, nan=0.0, posinf=0.0, neginf=0.0)
+    # En los deltas solo cuentan los aumentos: la vuelta a la normalidad tras un pico no es una anomalía
+    z = np.where(SOLO_AUMENTOS & (z < 0), 0.0, z)
+    anomalos = np.flatnonzero(np.abs(z).max(axis=(1, 2), initial=0.0) > umbral_z)
+    interfaces = list(interfaces) if interfaces is not None else [str(i) for i in range(X.shape[1])]
+    causas = {}
+    for i in anomalos:
+        # Las 'maximo_causas' parejas (interfaz, característica) con mayor |z| en esa muestra
+        plano = np.abs(z[i]).ravel(); orden = np.argsort(plano)[::-1][:maximo_causas]
+        causas[int(i)] = [{"interfaz": interfaces[k // len(CARACTERISTICAS)], "caracteristica": CARACTERISTICAS[k % len(CARACTERISTICAS)],
+                           "valor": float(X[i].ravel()[k]), "z": float(z[i].ravel()[k])} for k in orden if plano[k] > umbral_z]
+    return {"indices": anomalos, "z": z, "causas": causas, "interfaces": interfaces, "caracteristicas": CARACTERISTICAS}
+
+
+def detectar_anomalias_multivariante(tasas, n_ventana, interfaces=None, umbral_z=UMBRAL_Z_MULTIVARIANTE, ventana=VENTANA_MOVIL):
+    # Sin estado: puntúa las últimas 'n_ventana' muestras de 'tasas' (muestras, interfaces, métricas) frente a las anteriores
+    X = construir_caracteristicas(tasas, ventana)
+    n_ventana = min(int(n_ventana), len(X))
+    referencia = X[:len(X) - n_ventana] if len(X) - n_ventana >= MINIMO_AJUSTE else X
+    return puntuar_multivariante(X[len(X) - n_ventana:], *referencia_robusta(referencia), interfaces, umbral_z)
+
+
+class MotorMultivariante:
+    # Como MotorAnomalias: la referencia (mediana/MAD) se recalcula cada 'reajuste_cada' muestras nuevas o si cambian
+    # las interfaces; entre ajustes solo se construyen y puntúan las características de la ventana
+    def __init__(self, reajuste_cada=REAJUSTE_CADA, minimo_ajuste=MINIMO_AJUSTE, umbral_z=UMBRAL_Z_MULTIVARIANTE, ventana=VENTANA_MOVIL):
+        self.reajuste_cada = reajuste_cada; self.minimo_ajuste = minimo_ajuste; self.umbral_z = umbral_z; self.ventana = ventana
+        self.mediana = self.escala = None; self.ajustes = 0
+        self._forma = None; self._n_ajuste = 0; self._t_ajuste = -np.inf
+        self._lock = threading.Lock()
+
+    def _necesita_ajuste(self, tiempos_referencia, forma):
+        if self.mediana is None or forma != self._forma: return True
+        if self._n_ajuste < self.minimo_ajuste and len(tiempos_referencia) > self._n_ajuste: return True
+        return np.count_nonzero(tiempos_referencia > self._t_ajuste) >= self.reajuste_cada
+
+    @medida("anomalias.ajuste_multivariante")
+    def _ajustar(self, tiempos_referencia, tasas_referencia):
+        self.mediana, self.escala = referencia_robusta(construir_caracteristicas(tasas_referencia, self.ventana))
+        self._forma = tasas_referencia.shape[1:]; self._n_ajuste = len(tasas_referencia)
+        self._t_ajuste = tiempos_referencia[-1]; self.ajustes += 1
+
+    @medida("anomalias.multivariante")
+    def procesar(self, tiempos, tasas, n_ventana, interfaces=None):
+        # Puntúa las últimas 'n_ventana' muestras; las anteriores son la referencia (o todas, si aún son pocas)
+        tiempos = np.asarray(tiempos, dtype=float); tasas = np.asarray(tasas, dtype=float)
+        n_ventana = min(int(n_ventana), len(tasas)); inicio_ventana = len(tasas) - n_ventana
+        if n_ventana == 0: return puntuar_multivariante(np.empty((0,) + tasas.shape[1:-1] + (len(CARACTERISTICAS),)), 0.0, 1.0, interfaces)
+        with self._lock:
+            fin_referencia = inicio_ventana if inicio_ventana >= self.minimo_ajuste else len(tasas)
+            if self._necesita_ajuste(tiempos[:fin_referencia], tasas.shape[1:]): self._ajustar(tiempos[:fin_referencia], tasas[:fin_referencia])
+            # Para los deltas y la ventana móvil basta con las 'ventana' muestras previas a la ventana puntuada
+            X = construir_caracteristicas(tasas[max(0, inicio_ventana - self.ventana - 1):], self.ventana)
+            X = X[len(X) - n_ventana:]
+            return puntuar_multivariante(X, self.mediana, self.escala, interfaces, self.umbral_z)
+
+
+# --- Instancia única por proceso ---
+_motor = None
+_motor_lock = threading.Lock()
+
+def obtener_motor():
+    global _motor
+    with _motor_lock:
+        if _motor is None: _motor = MotorAnomalias()
+        return _motor
+
+_motor_multivariante = None
+
+def obtener_motor_multivariante():
+    global _motor_multivariante
+    with _motor_lock:
+        if _motor_multivariante is None: _motor_multivariante = MotorMultivariante()
+        return _motor_multivariante
@@ -0,0 +1,168 @@
+# benchmark.py - Banco de pruebas de las rutas críticas con tráfico sintético; compara con una línea base guardada
+#   python benchmark.py                       # mide y compara con benchmark_base.json si existe
+#   python benchmark.py --guardar-base        # mide y guarda el resultado como nueva línea base
+#   python benchmark.py --casos create_metric_card --tamanos 1e2,1e4
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from anomalias import MotorAnomalias, MotorMultivariante, detectar_anomalias
+from colector import BufferCircular
+from graficos import crear_grafico_plotly_tasa
+from muestreo import METRICAS, MuestreadorInterfaces, tasa_total
+from sintetico import ContadoresSinteticos, serie_sintetica
+from tarjetas import create_metric_card, html_tarjeta
+
+# --- Configuración ---
+TAMANOS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+FICHERO_BASE = "benchmark_base.json"
+TOLERANCIA = 0.25            # Regresión si el mínimo o el pico de memoria empeoran más que esto respecto a la base
+RUIDO_MINIMO_MS = 0.5        # Diferencias de tiempo menores se consideran ruido aunque superen la tolerancia
+RUIDO_MINIMO_MB = 1.0
+TIEMPO_MINIMO_S = 1.0        # Repeticiones por caso hasta acumular este tiempo...
+REPETICIONES = (3, 30)       # ...con este mínimo y máximo
+PRESUPUESTO_CASO_S = 20.0    # Tamaños cuya duración estimada supere esto no se miden (se marcan como omitidos)
+INTERFACES_MUESTREO = 8
+
+
+# --- Casos: cada uno prepara los datos fuera de la medida y devuelve la función a medir ---
+def caso_anomalias(n):
+    tiempos, valores, _ = serie_sintetica(n)
+    # Motor nuevo en cada repetición: incluye el ajuste inicial, como la primera llamada del proceso
+    return lambda: detectar_anomalias(valores, tiempos, motor=MotorAnomalias())
+
+def caso_multivariante(n):
+    # n segundos x INTERFACES_MUESTREO interfaces x todas las métricas; la serie sintética se reparte entre las celdas
+    _, valores, _ = serie_sintetica(n * INTERFACES_MUESTREO * len(METRICAS))
+    tasas = valores.reshape(n, INTERFACES_MUESTREO, len(METRICAS)); tiempos = np.arange(n, dtype=float)
+    return lambda: MotorMultivariante().procesar(tiempos, tasas, n)
+
+def caso_grafico(n):
+    _, valores, en_rafaga = serie_sintetica(n)
+    anomalias = np.flatnonzero(en_rafaga)
+    return lambda: crear_grafico_plotly_tasa(valores, anomalias)
+
+def caso_tarjetas(n):
+    # n tarjetas con valores distintos (incluidos NaN): mide el formateo, no los aciertos de la caché
+    valores = serie_sintetica(n)[1].tolist()
+    titulos = ("Latencia Media ms", "Velocidad Descarga Mbps", "Paquetes Perdidos", "Tasa")
+    def ejecutar():
+        html_tarjeta.cache_clear()
+        for i, v in enumerate(valores): create_metric_card(titulos[i % len(titulos)], v, "⏱️", "bench")
+    return ejecutar
+
+def caso_muestreo(n):
+    # n ciclos del bucle del colector (leer contadores, calcular tasas, guardar en el buffer) con psutil simulado
+    fuente = ContadoresSinteticos(INTERFACES_MUESTREO)
+    def ejecutar():
+        muestreador = MuestreadorInterfaces(bits_contador=32, fuente=fuente)
+        buffer = BufferCircular(3600, muestreador.forma)
+        for i in range(n):
+            tasas = muestreador.muestrear(float(i))
+            if tasas is not None: buffer.agregar(float(i), tasas)
+        return tasa_total(buffer.ventana()[1])
+    return ejecutar
+
+CASOS = {"detectar_anomalias": caso_anomalias, "detectar_anomalias_multivariante": caso_multivariante, "crear_grafico_plotly_tasa": caso_grafico,
+         "create_metric_card": caso_tarjetas, "bucle_muestreo": caso_muestreo}
+
+
+# --- Medida ---
+def medir(preparar, n, tiempo_minimo_s=TIEMPO_MINIMO_S):
+    ejecutar = preparar(n)
+    # Una ejecución de calentamiento (importaciones perezosas, cachés) y otra con tracemalloc, que también ve numpy,
+    # para el pico de memoria; ninguna de las dos cuenta en los tiempos
+    ejecutar()
+    tracemalloc.start(); ejecutar(); _, pico = tracemalloc.get_traced_memory(); tracemalloc.stop()
+    duraciones = []
+    while len(duraciones) < REPETICIONES[1]:
+        inicio = time.perf_counter(); ejecutar(); duraciones.append(time.perf_counter() - inicio)
+        if len(duraciones) >= REPETICIONES[0] and sum(duraciones) >= tiempo_minimo_s: break
+    d = np.array(duraciones) * 1000
+    p50, p95, p99 = np.percentile(d, [50, 95, 99])
+    return {"repeticiones": len(d), "min_ms": d.min(), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": d.max(),
+            "puntos_s": n / (p50 / 1000), "pico_mb": pico / 2**20}
+
+
+def ejecutar_banco(casos, tamanos, presupuesto_s=PRESUPUESTO_CASO_S, tiempo_minimo_s=TIEMPO_MINIMO_S):
+    resultados = {}
+    for nombre in casos:
+        resultados[nombre] = {}; anterior = None
+        for n in tamanos:
+            # Estimación lineal desde el tamaño anterior: evita lanzar ejecuciones de minutos
+            if anterior is not None and anterior[1] / 1000 * n / anterior[0] > presupuesto_s:
+                resultados[nombre][str(n)] = None; print(f"{nombre:34} n={n:>10,}  omitido (> {presupuesto_s:g} s estimados)", flush=True); continue
+            r = resultados[nombre][str(n)] = medir(CASOS[nombre], n, tiempo_minimo_s)
+            anterior = (n, r["p50_ms"])
+            print(f"{nombre:34} n={n:>10,}  min {r['min_ms']:10.2f} ms  p50 {r['p50_ms']:10.2f} ms  p95 {r['p95_ms']:10.2f} ms  "
+                  f"{r['puntos_s']:14,.0f} puntos/s  pico {r['pico_mb']:8.1f} MB", flush=True)
+    return resultados
+
+
+# --- Línea base ---
+def comparar(resultados, base, tolerancia=TOLERANCIA):
+    filas = []
+    for nombre, por_tamano in resultados.items():
+        for n, r in por_tamano.items():
+            b = base.get(nombre, {}).get(n)
+            if r is None or b is None or "min_ms" not in b: continue
+            # El mínimo de las repeticiones es mucho más estable que la mediana frente a la carga de la máquina
+            ratio_t = r["min_ms"] / b["min_ms"] if b["min_ms"] > 0 else np.nan
+            ratio_m = r["pico_mb"] / b["pico_mb"] if b["pico_mb"] > 0 else np.nan
+            regresion = ((ratio_t > 1 + tolerancia and r["min_ms"] - b["min_ms"] > RUIDO_MINIMO_MS) or
+                         (ratio_m > 1 + tolerancia and r["pico_mb"] - b["pico_mb"] > RUIDO_MINIMO_MB))
+            filas.append({"caso": nombre, "n": int(n), "min_ms": r["min_ms"], "base_min_ms": b["min_ms"], "x_tiempo": ratio_t,
+                          "pico_mb": r["pico_mb"], "base_pico_mb": b["pico_mb"], "x_memoria": ratio_m, "regresion": regresion})
+    return pd.DataFrame(filas)
+
+
+def entorno():
+    return {"fecha": datetime.datetime.now(datetime.timezone.utc).isoformat(), "python": platform.python_version(),
+            "numpy": np.__version__, "plataforma": platform.platform(), "procesador": platform.processor() or platform.machine()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banco de pruebas de las rutas críticas con tráfico sintético.")
+    parser.add_argument("--casos", default=",".join(CASOS), help=f"Casos separados por comas ({', '.join(CASOS)}).")
+    parser.add_argument("--tamanos", default=",".join(f"{n:g}" for n in TAMANOS), help="Tamaños de serie separados por comas (p.ej. 1e2,1e4).")
+    parser.add_argument("--base", default=FICHERO_BASE, help="Fichero JSON con la línea base.")
+    parser.add_argument("--guardar-base", action="store_true", help="Guarda estos resultados como nueva línea base.")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    parser.add_argument("--presupuesto", type=float, default=PRESUPUESTO_CASO_S, help="Segundos máximos estimados por repetición.")
+    parser.add_argument("--tiempo-minimo", type=float, default=TIEMPO_MINIMO_S, help="Segundos acumulados de repeticiones por caso.")
+    args = parser.parse_args(argv)
+    casos = [c.strip() for c in args.casos.split(",") if c.strip()]
+    desconocidos = [c for c in casos if c not in CASOS]
+    if desconocidos: parser.error(f"Casos desconocidos: {', '.join(desconocidos)}")
+    tamanos = [int(float(t)) for t in args.tamanos.split(",") if t.strip()]
+
+    resultados = ejecutar_banco(casos, tamanos, args.presupuesto, args.tiempo_minimo)
+    codigo = 0
+    if os.path.exists(args.base):
+        with open(args.base) as f: base = json.load(f)
+        # Las bases de otra máquina no son comparables: solo se avisa
+        if base["entorno"].get("procesador") != entorno()["procesador"]: print(f"\n⚠️ La línea base se midió en otro procesador ({base['entorno'].get('procesador')}).")
+        comparacion = comparar(resultados, base["resultados"], args.tolerancia)
+        if not comparacion.empty:
+            print(f"\nComparación con {args.base} ({base['entorno']['fecha']}):")
+            print(comparacion.round(2).to_string(index=False))
+            if comparacion["regresion"].any():
+                print(f"\n❌ {int(comparacion['regresion'].sum())} regresión(es) por encima del {args.tolerancia:.0%}."); codigo = 1
+            else: print(f"\n✅ Sin regresiones (tolerancia {args.tolerancia:.0%}).")
+    if args.guardar_base:
+        with open(args.base, "w") as f: json.dump({"entorno": entorno(), "resultados": resultados}, f, indent=2)
+        print(f"\nLínea base guardada en {args.base}.")
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
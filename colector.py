@@ -0,0 +1,153 @@
+# colector.py - Colector de tráfico en segundo plano, compartido por todas las sesiones
+
+import threading
+import time
+
+import numpy as np
+import psutil
+
+from instrumentacion import etapa
+from muestreo import METRICAS, MuestreadorInterfaces, tasa_total
+
+# --- Configuración ---
+INTERVALO_MUESTREO_S = 1.0  # Admite intervalos por debajo del segundo (p.ej. 0.1 para microráfagas)
+CAPACIDAD_BUFFER_S = 3600  # Segundos de historial en memoria; en muestras depende del intervalo
+PERSISTIR_CADA_S = 10    # Cada cuánto se pasan las muestras nuevas al almacén (en lote, no por muestra)
+
+
+# --- Buffer circular de tamaño fijo respaldado por numpy ---
+class BufferCircular:
+    def __init__(self, capacidad, forma=()):
+        # 'forma' es la forma de cada muestra: () para un escalar, (interfaces, métricas) para matrices
+        self.capacidad = int(capacidad)
+        self._tiempos = np.full(self.capacidad, np.nan)
+        self._valores = np.full((self.capacidad,) + tuple(forma), np.nan)
+        self._escritos = 0  # Total de muestras escritas desde el inicio
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._escritos, self.capacidad)
+
+    def agregar(self, tiempo, valor):
+        with self._lock:
+            pos = self._escritos % self.capacidad
+            self._tiempos[pos] = tiempo; self._valores[pos] = valor
+            self._escritos += 1
+
+    @property
+    def escritos(self):
+        return self._escritos
+
+    def desde(self, escritos_previos):
+        # Muestras escritas después de 'escritos_previos' (coste proporcional a las nuevas, no al buffer);
+        # devuelve también el nuevo contador para la siguiente llamada
+        with self._lock:
+            n = max(0, min(self._escritos - int(escritos_previos), self.capacidad, self._escritos))
+            idx = np.arange(self._escritos - n, self._escritos) % self.capacidad
+            return self._tiempos[idx].copy(), self._valores[idx].copy(), self._escritos
+
+    def ventana(self, n=None):
+        # Devuelve copias (tiempos, valores) de las últimas n muestras en orden cronológico
+        with self._lock:
+            disponibles = min(self._escritos, self.capacidad)
+            n = disponibles if n is None else max(0, min(int(n), disponibles))
+            if n == 0: return np.array([]), np.array([])
+            fin = self._escritos % self.capacidad
+            idx = (np.arange(fin - n, fin)) % self.capacidad
+            return self._tiempos[idx].copy(), self._valores[idx].copy()
+
+
+# --- Hilo colector ---
+class ColectorTrafico:
+    def __init__(self, intervalo_s=INTERVALO_MUESTREO_S, capacidad=None, interfaces=None, bits_contador=None, almacen=None, fuente=psutil):
+        self.intervalo_s = intervalo_s
+        self.almacen = almacen; self._ultimo_persistido = -np.inf; self._proximo_persistir = 0.0
+        self.muestreador = MuestreadorInterfaces(interfaces, bits_contador, fuente)
+        self.interfaces = self.muestreador.interfaces
+        # Por defecto una hora a cualquier intervalo (a 0.1 s son 36000 muestras): la capacidad escala con el intervalo, como en el agente
+        if capacidad is None: capacidad = max(CAPACIDAD_BUFFER_S, int(np.ceil(CAPACIDAD_BUFFER_S / intervalo_s)))
+        self.buffer = BufferCircular(capacidad, self.muestreador.forma)
+        self.error = None
+        self._parar = threading.Event()
+        self._hilo = None
+        self._arranque_lock = threading.Lock()
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self):
+        with self._arranque_lock:
+            if self.activo: return self
+            self._parar.clear()
+            self._hilo = threading.Thread(target=self._bucle, name="colector-trafico", daemon=True)
+            self._hilo.start()
+        return self
+
+    def detener(self, timeout=None):
+        self._parar.set()
+        if self._hilo is not None: self._hilo.join(timeout)
+
+    def ventana_interfaces(self, segundos):
+        # Últimas muestras que cubren 'segundos': (tiempos, tasas[muestra, interfaz, métrica])
+        return self.buffer.ventana(int(round(segundos / self.intervalo_s)))
+
+    def ventana(self, segundos):
+        # Tasa total (Bytes/s enviados + recibidos) agregada por segundo
+        tiempos, tasas = self.ventana_interfaces(segundos)
+        if len(tiempos) == 0: return tiempos, np.array([])
+        return agregar_por_segundo(tiempos, tasa_total(tasas), self.intervalo_s)
+
+    def _bucle(self):
+        try: self.muestreador.muestrear(time.monotonic())
+        except Exception as e: self.error = str(e)
+        siguiente = time.monotonic() + self.intervalo_s
+        while not self._parar.wait(max(0.0, siguiente - time.monotonic())):
+            siguiente += self.intervalo_s
+            try:
+                with etapa("colector.muestreo"):
+                    tasas = self.muestreador.muestrear(time.monotonic())
+                    if tasas is not None: self.buffer.agregar(time.time(), tasas); self.error = None
+                if self.almacen is not None and time.monotonic() >= self._proximo_persistir:
+                    self._proximo_persistir = time.monotonic() + PERSISTIR_CADA_S
+                    with etapa("colector.persistir"): self._persistir()
+            except Exception as e:
+                self.error = str(e); self.buffer.agregar(time.time(), np.nan)
+            # Si el hilo se retrasa (p.ej. suspensión), no intentar recuperar muestras perdidas
+            if siguiente < time.monotonic(): siguiente = time.monotonic() + self.intervalo_s
+
+
+    def _persistir(self):
+        tiempos, tasas = self.buffer.ventana()
+        nuevas = tiempos > self._ultimo_persistido
+        if not nuevas.any(): return
+        tiempos = tiempos[nuevas]; tasas = tasas[nuevas]
+        self.almacen.agregar("trafico", tiempos, tasa_bps=tasa_total(tasas))
+        for i, interfaz in enumerate(self.interfaces):
+            self.almacen.agregar(f"nic/{interfaz}", tiempos, **{m: tasas[:, i, j] for j, m in enumerate(METRICAS)})
+        self._ultimo_persistido = tiempos[-1]
+
+
+def agregar_por_segundo(tiempos, valores, intervalo_s):
+    # Media por bloques de 1 s cuando se muestrea por debajo del segundo (bloques completos, los más recientes).
+    # 'valores' puede ser una serie o un tensor (muestra, interfaz, métrica): se promedia sobre el primer eje
+    por_bloque = int(round(1.0 / intervalo_s)) if intervalo_s < 1.0 else 1
+    if por_bloque <= 1: return tiempos, valores
+    n = (len(valores) // por_bloque) * por_bloque
+    if n == 0: return np.array([]), np.empty((0,) + np.shape(valores)[1:])
+    bloques = valores[len(valores) - n:].reshape((-1, por_bloque) + valores.shape[1:])
+    validos = np.isfinite(bloques).sum(axis=1)
+    medias = np.where(validos > 0, np.nansum(bloques, axis=1) / np.maximum(validos, 1), np.nan)
+    return tiempos[len(tiempos) - n:].reshape(-1, por_bloque)[:, -1], medias
+
+
+# --- Instancia única por proceso ---
+_colector = None
+_colector_lock = threading.Lock()
+
+def obtener_colector(almacen=None):
+    # 'almacen' solo se aplica al crear la instancia (primera llamada del proceso)
+    global _colector
+    with _colector_lock:
+        if _colector is None: _colector = ColectorTrafico(almacen=almacen)
+        return _colector.iniciar()
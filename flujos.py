@@ -0,0 +1,283 @@
+# flujos.py - Agregación de flujos por captura de paquetes (scapy) o pcap: "top talkers" por 5-tupla, host, puerto y proceso
+
+import ipaddress
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import psutil
+
+# --- Configuración ---
+MAXIMO_FLUJOS = 50000          # Registros de flujo en memoria; al superarlo se expulsan los inactivos y los menores
+INACTIVIDAD_S = 60             # Un flujo sin paquetes durante este tiempo puede expulsarse
+TOP_K = 20                     # Elementos vigilados por cada resumen de "heavy hitters"
+TOP_POR_SEGUNDO = 8            # Flujos vigilados por segundo (para explicar anomalías)
+SEGUNDOS_RETENIDOS = 3600      # Segundos con flujos vigilados que se conservan (igual que el buffer del colector)
+REFRESCO_PROCESOS_S = 5        # Cada cuánto se relee la tabla de sockets para atribuir flujos a procesos
+TAMANO_BUFFER_SOCKET = 8 * 1024 * 1024
+
+ENLACE_ETHERNET, ENLACE_IP, ENLACE_SLL = 1, 101, 113   # Tipos de enlace pcap admitidos (DLT_*)
+PROTOCOLOS = {1: "ICMP", 6: "TCP", 17: "UDP", 58: "ICMPv6"}
+_ETHERTYPE_VLAN = (0x8100, 0x88A8)
+
+
+# --- Decodificación mínima de tramas ---
+def parsear_trama(datos, enlace=ENLACE_ETHERNET):
+    # Extrae (origen, destino, protocolo, puerto_origen, puerto_destino) directamente de los bytes, sin diseccionar
+    # con scapy (unas 50 veces más caro por paquete). Las direcciones quedan empaquetadas y se formatean al mostrarlas.
+    if enlace == ENLACE_ETHERNET:
+        if len(datos) < 14: return None
+        tipo = (datos[12] << 8) | datos[13]; i = 14
+        while tipo in _ETHERTYPE_VLAN and len(datos) >= i + 4: tipo = (datos[i + 2] << 8) | datos[i + 3]; i += 4
+    elif enlace == ENLACE_SLL:
+        if len(datos) < 16: return None
+        tipo = (datos[14] << 8) | datos[15]; i = 16
+    elif enlace == ENLACE_IP:
+        if not datos: return None
+        tipo = 0x0800 if datos[0] >> 4 == 4 else 0x86DD; i = 0
+    else: return None
+    if tipo == 0x0800:
+        if len(datos) < i + 20: return None
+        proto = datos[i + 9]; origen = datos[i + 12:i + 16]; destino = datos[i + 16:i + 20]
+        # Los fragmentos que no son el primero no llevan cabecera de transporte
+        l4 = i + (datos[i] & 0x0F) * 4 if not ((datos[i + 6] & 0x1F) | datos[i + 7]) else None
+    elif tipo == 0x86DD:
+        if len(datos) < i + 40: return None
+        proto = datos[i + 6]; origen = datos[i + 8:i + 24]; destino = datos[i + 24:i + 40]; l4 = i + 40  # Sin cabeceras de extensión
+    else: return None
+    if l4 is not None and proto in (6, 17) and len(datos) >= l4 + 4:
+        puerto_origen, puerto_destino = struct.unpack_from("!HH", datos, l4)
+    else: puerto_origen = puerto_destino = 0
+    return origen, destino, proto, puerto_origen, puerto_destino
+
+
+def formatear_ip(empaquetada):
+    return str(ipaddress.ip_address(empaquetada))
+
+
+# --- Estructuras compactas ---
+class RegistroFlujo:
+    __slots__ = ("bytes", "paquetes", "primero", "ultimo", "pid")
+
+    def __init__(self, t, pid):
+        self.bytes = 0; self.paquetes = 0; self.primero = t; self.ultimo = t; self.pid = pid
+
+
+class EspacioAhorro:
+    # Resumen Space-Saving de los elementos más pesados con memoria acotada (como mucho 2*k claves).
+    # Las claves nuevas heredan 'minimo' (cota superior de lo que pudo contarse antes de expulsarlas), así que
+    # 'cuenta' nunca infraestima y 'cuenta - error' nunca sobreestima. La poda es por lotes: O(1) amortizado.
+    __slots__ = ("k", "contadores", "minimo", "total")
+
+    def __init__(self, k=TOP_K):
+        self.k = k; self.contadores = {}; self.minimo = 0; self.total = 0
+
+    def agregar(self, clave, peso=1):
+        self.total += peso
+        c = self.contadores.get(clave)
+        if c is not None: c[0] += peso; return
+        if len(self.contadores) >= 2 * self.k: self._podar()
+        self.contadores[clave] = [self.minimo + peso, self.minimo]
+
+    def _podar(self):
+        cuentas = np.fromiter((c[0] for c in self.contadores.values()), dtype=float, count=len(self.contadores))
+        corte = np.partition(cuentas, len(cuentas) - self.k)[len(cuentas) - self.k]
+        # Se conservan las k mayores (los empates en el corte también se eliminan si sobran)
+        salen = [clave for clave, c in self.contadores.items() if c[0] < corte]
+        for clave in [clave for clave, c in self.contadores.items() if c[0] == corte][:len(self.contadores) - len(salen) - self.k]: salen.append(clave)
+        self.minimo = max(self.minimo, max(self.contadores[clave][0] for clave in salen))
+        for clave in salen: del self.contadores[clave]
+
+    def fusionar(self, otro):
+        for clave, (cuenta, error) in otro.contadores.items():
+            c = self.contadores.get(clave)
+            if c is not None: c[0] += cuenta; c[1] += error
+            else: self.contadores[clave] = [cuenta, error]
+        self.total += otro.total
+
+    def top(self, n=None):
+        # [(clave, cuenta, error)] de mayor a menor
+        orden = sorted(self.contadores.items(), key=lambda kv: kv[1][0], reverse=True)[:n or self.k]
+        return [(clave, c[0], c[1]) for clave, c in orden]
+
+
+# --- Agregador ---
+class AgregadorFlujos:
+    def __init__(self, maximo_flujos=MAXIMO_FLUJOS, k=TOP_K, top_por_segundo=TOP_POR_SEGUNDO, segundos_retenidos=SEGUNDOS_RETENIDOS):
+        self.maximo_flujos = maximo_flujos; self.top_por_segundo = top_por_segundo
+        self.flujos = {}     # (origen, destino, proto, puerto_origen, puerto_destino) -> RegistroFlujo
+        self.hosts = EspacioAhorro(k); self.puertos = EspacioAhorro(k); self.procesos = EspacioAhorro(k)
+        self.segundos = deque(maxlen=segundos_retenidos)   # (segundo, EspacioAhorro de flujos de ese segundo)
+        self.paquetes = 0; self.bytes = 0; self.descartados = 0; self.expulsados = 0
+        self.ips_locales = set(); self.sockets = {}        # (proto, puerto local) -> pid
+        self._segundo = None; self._resumen_segundo = None
+        self._lock = threading.Lock()
+
+    def actualizar_procesos(self):
+        # Tabla de sockets del sistema; se sustituye de golpe para no bloquear el procesado de paquetes
+        sockets = {}
+        for c in psutil.net_connections(kind="inet"):
+            if c.pid and c.laddr: sockets[(6 if c.type == socket.SOCK_STREAM else 17, c.laddr.port)] = c.pid
+        ips = {socket.inet_pton(d.family, d.address.split("%")[0]) for dirs in psutil.net_if_addrs().values() for d in dirs
+               if d.family in (socket.AF_INET, socket.AF_INET6)}
+        self.sockets = sockets; self.ips_locales = ips
+
+    def procesar(self, t, datos, longitud=None, enlace=ENLACE_ETHERNET, peso=1):
+        campos = parsear_trama(datos, enlace)
+        if campos is None: self.descartados += 1; return
+        longitud = (len(datos) if longitud is None else longitud) * peso
+        origen, destino, proto, puerto_origen, puerto_destino = campos
+        with self._lock:
+            self.paquetes += peso; self.bytes += longitud
+            flujo = self.flujos.get(campos)
+            if flujo is None:
+                if len(self.flujos) >= self.maximo_flujos: self._expulsar(t)
+                flujo = self.flujos[campos] = RegistroFlujo(t, None)
+            if flujo.pid is None and self.sockets:
+                # Proceso por el extremo local del flujo; se reintenta hasta que la tabla de sockets refrescada lo incluya
+                if origen in self.ips_locales: flujo.pid = self.sockets.get((proto, puerto_origen))
+                elif destino in self.ips_locales: flujo.pid = self.sockets.get((proto, puerto_destino))
+            flujo.bytes += longitud; flujo.paquetes += peso; flujo.ultimo = t
+            self.hosts.agregar(origen, longitud); self.hosts.agregar(destino, longitud)
+            # Puerto de servicio: el menor de los dos suele ser el del servidor (443, 53...), el otro es efímero
+            if puerto_origen or puerto_destino: self.puertos.agregar((proto, min(puerto_origen, puerto_destino)), longitud)
+            if flujo.pid is not None: self.procesos.agregar(flujo.pid, longitud)
+            segundo = int(t)
+            if segundo != self._segundo:
+                self._segundo = segundo; self._resumen_segundo = EspacioAhorro(self.top_por_segundo)
+                self.segundos.append((segundo, self._resumen_segundo))
+            self._resumen_segundo.agregar(campos, longitud)
+
+    def _expulsar(self, t):
+        # Primero los flujos inactivos; si no basta, la mitad con menos bytes (su peso sigue en los resúmenes top-K)
+        inactivos = [clave for clave, f in self.flujos.items() if t - f.ultimo > INACTIVIDAD_S]
+        if len(self.flujos) - len(inactivos) > self.maximo_flujos // 2:
+            bytes_flujos = np.fromiter((f.bytes for f in self.flujos.values()), dtype=float, count=len(self.flujos))
+            corte = np.median(bytes_flujos)
+            inactivos = [clave for clave, f in self.flujos.items() if f.bytes <= corte or t - f.ultimo > INACTIVIDAD_S]
+        for clave in inactivos: del self.flujos[clave]
+        self.expulsados += len(inactivos)
+
+    # --- Consultas (formateadas para mostrar) ---
+    @staticmethod
+    def _nombre_proceso(pid):
+        if pid is None: return None
+        try: return f"{psutil.Process(pid).name()} ({pid})"
+        except psutil.Error: return str(pid)
+
+    def _describir_flujo(self, clave, bytes_flujo, total):
+        origen, destino, proto, puerto_origen, puerto_destino = clave
+        flujo = self.flujos.get(clave)
+        return {"origen": formatear_ip(origen) + (f":{puerto_origen}" if puerto_origen else ""),
+                "destino": formatear_ip(destino) + (f":{puerto_destino}" if puerto_destino else ""),
+                "protocolo": PROTOCOLOS.get(proto, str(proto)), "bytes": bytes_flujo, "cuota": bytes_flujo / total if total else np.nan,
+                "proceso": self._nombre_proceso(flujo.pid) if flujo is not None else None}
+
+    def top_flujos(self, n=TOP_K):
+        with self._lock:
+            orden = sorted(self.flujos.items(), key=lambda kv: kv[1].bytes, reverse=True)[:n]
+            return [dict(self._describir_flujo(clave, f.bytes, self.bytes), paquetes=f.paquetes, duracion_s=f.ultimo - f.primero) for clave, f in orden]
+
+    def top_hosts(self, n=TOP_K):
+        with self._lock: return [{"host": formatear_ip(h), "bytes": c, "error_max": e} for h, c, e in self.hosts.top(n)]
+
+    def top_puertos(self, n=TOP_K):
+        with self._lock:
+            return [{"puerto": f"{PROTOCOLOS.get(proto, proto)}/{puerto}", "bytes": c, "error_max": e} for (proto, puerto), c, e in self.puertos.top(n)]
+
+    def top_procesos(self, n=TOP_K):
+        with self._lock: return [{"proceso": self._nombre_proceso(pid), "bytes": c, "error_max": e} for pid, c, e in self.procesos.top(n)]
+
+    def flujos_en(self, desde, hasta, n=5):
+        # Flujos con más bytes en los segundos que solapan [desde, hasta): enlaza un segundo anómalo con sus causas
+        with self._lock:
+            resumen = EspacioAhorro(self.top_por_segundo)
+            for segundo, resumen_segundo in reversed(self.segundos):
+                if segundo + 1 <= desde: break
+                if segundo < hasta: resumen.fusionar(resumen_segundo)
+            # Con k pequeño por segundo, 'cuenta' puede heredar casi todo el mínimo: se muestra 'cuenta - error', cota
+            # inferior garantizada, y se descartan los flujos sin bytes seguros (solo aparecen por la herencia)
+            seguros = sorted(((clave, c[0] - c[1]) for clave, c in resumen.contadores.items() if c[0] - c[1] > 0), key=lambda kv: kv[1], reverse=True)
+            return [self._describir_flujo(clave, c, resumen.total) for clave, c in seguros[:n]]
+
+
+# --- Fuentes: captura en directo y pcap ---
+def leer_pcap(ruta, agregador=None):
+    # Reproduce un pcap con sus marcas de tiempo originales (sin diseccionar los paquetes)
+    from scapy.utils import RawPcapReader
+    agregador = agregador or AgregadorFlujos()
+    with RawPcapReader(ruta) as lector:
+        enlace = getattr(lector, "linktype", ENLACE_ETHERNET)
+        # pcap clásico de nanosegundos (magic a1b23c4d): scapy deja los ns en 'usec'
+        fraccion = 1e9 if getattr(lector, "nano", False) else 1e6
+        for datos, meta in lector:
+            # pcap clásico (sec/usec) o pcapng (marca de 64 bits con resolución y tipo de enlace por interfaz)
+            t = meta.sec + meta.usec / fraccion if hasattr(meta, "usec") else (meta.tshigh << 32 | meta.tslow) / meta.tsresol
+            agregador.procesar(t, datos, getattr(meta, "wirelen", None) or len(datos), getattr(meta, "linktype", enlace))
+    return agregador
+
+
+class CapturaFlujos:
+    # Captura en directo con un socket de scapy en modo lectura de bytes crudos (requiere root / CAP_NET_RAW).
+    # 'muestreo' = N procesa 1 de cada N tramas con peso N (estilo sFlow) para aguantar enlaces saturados.
+    def __init__(self, agregador=None, interfaz=None, filtro=None, muestreo=1):
+        self.agregador = agregador or AgregadorFlujos()
+        self.interfaz = interfaz; self.filtro = filtro; self.muestreo = max(1, int(muestreo))
+        self.error = None; self._parar = threading.Event(); self._hilos = []
+
+    @property
+    def activa(self):
+        return any(h.is_alive() for h in self._hilos)
+
+    def iniciar(self):
+        if self.activa: return self
+        import scapy.arch   # Registra en 'conf' los sockets de captura del sistema
+        from scapy.config import conf
+        self.error = None; self._parar.clear()
+        try:
+            socket_captura = conf.L2listen(iface=self.interfaz or conf.iface, filter=self.filtro)
+            socket_captura.ins.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, TAMANO_BUFFER_SOCKET)
+        except Exception as e:
+            self.error = "Sin permisos para capturar paquetes (se necesita root o CAP_NET_RAW)." if isinstance(e, PermissionError) else f"{type(e).__name__}: {e}"
+            return self
+        self._hilos = [threading.Thread(target=self._bucle, args=(socket_captura,), name="captura-flujos", daemon=True),
+                       threading.Thread(target=self._bucle_procesos, name="captura-procesos", daemon=True)]
+        for h in self._hilos: h.start()
+        return self
+
+    def detener(self):
+        self._parar.set()
+
+    def _bucle(self, socket_captura):
+        agregador = self.agregador; contador = 0
+        try:
+            while not self._parar.is_set():
+                if not select.select([socket_captura], [], [], 0.5)[0]: continue
+                _, datos, t = socket_captura.recv_raw(65535)
+                if datos is None: continue
+                contador += 1
+                if contador % self.muestreo: continue
+                agregador.procesar(t or time.time(), datos, peso=self.muestreo)
+        except Exception as e: self.error = f"{type(e).__name__}: {e}"
+        finally: socket_captura.close()
+
+    def _bucle_procesos(self):
+        while True:
+            try: self.agregador.actualizar_procesos()
+            except psutil.Error: pass   # Sin permisos solo se atribuyen los sockets propios
+            if self._parar.wait(REFRESCO_PROCESOS_S): return
+
+
+# --- Instancia única por proceso ---
+_captura = None
+_captura_lock = threading.Lock()
+
+def obtener_captura():
+    global _captura
+    with _captura_lock:
+        if _captura is None: _captura = CapturaFlujos()
+        return _captura
@@ -0,0 +1,166 @@
+# graficos.py - Gráficos de tasa con reducción de puntos (LTTB / min-max), WebGL y figura reutilizable
+
+import numpy as np
+import plotly.graph_objects as go
+
+from instrumentacion import medida
+
+# --- Configuración ---
+PRESUPUESTO_PUNTOS = 2000   # Puntos máximos enviados al navegador por traza (~ ancho en píxeles del gráfico)
+UMBRAL_WEBGL = 1000         # Por encima de estos puntos se usa Scattergl en lugar de SVG
+UMBRAL_MARCADORES = 100     # Marcadores en cada punto solo para series cortas
+MAXIMO_ANOMALIAS = 500      # Anomalías conservadas en la figura en directo (las más recientes)
+ESCALA_LOG_DESDE = 50000
+PLANTILLA_NORMAL = "Seg: %{x}<br>Tasa: %{y:,.0f} B/s<br>Normal<extra></extra>"
+PLANTILLA_ANOMALIA = "Seg: %{x}<br>Tasa: %{y:,.0f} B/s<br><b>Anomalía</b><extra></extra>"
+
+
+# --- Reducción de puntos ---
+def lttb(x, y, umbral):
+    # Largest-Triangle-Three-Buckets: índices de 'umbral' puntos que conservan la forma visual de la serie
+    n = len(x)
+    if umbral >= n or umbral < 3: return np.arange(n)
+    x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float)
+    bordes = np.linspace(1, n - 1, umbral - 1).astype(int)
+    indices = np.empty(umbral, dtype=int); indices[0] = 0; indices[-1] = n - 1
+    a = 0
+    for i in range(umbral - 2):
+        ini, fin = bordes[i], bordes[i + 1]
+        sig_fin = bordes[i + 2] if i + 2 < len(bordes) else n
+        with np.errstate(all='ignore'):
+            media_x = x[fin:sig_fin].mean(); media_y = np.nanmean(y[fin:sig_fin]) if np.isfinite(y[fin:sig_fin]).any() else y[a]
+        areas = np.abs((x[a] - media_x) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (media_y - y[a]))
+        a = ini + int(np.argmax(np.nan_to_num(areas, nan=-1.0)))
+        indices[i + 1] = a
+    return indices
+
+
+def reducir_serie(y, anomalias_indices=(), presupuesto=PRESUPUESTO_PUNTOS):
+    # Índices a dibujar: LTTB sobre la serie más todas las anomalías, que nunca se descartan
+    y = np.asarray(y, dtype=float)
+    if len(y) <= presupuesto: return np.arange(len(y))
+    indices = lttb(np.arange(len(y), dtype=float), y, presupuesto)
+    anomalias = np.asarray(anomalias_indices, dtype=int)
+    return np.union1d(indices, anomalias[(anomalias >= 0) & (anomalias < len(y))])
+
+
+class ReductorMinMax:
+    # Reducción incremental por cubos min/max: cada 'agregar' cuesta O(puntos nuevos) y la salida nunca supera
+    # el presupuesto. Cuando se llenan los cubos, se fusionan por parejas y se dobla su ancho.
+    def __init__(self, presupuesto=PRESUPUESTO_PUNTOS):
+        self.max_cubos = max(2, presupuesto // 2)
+        self.ancho = 1; self.total = 0
+        self._cubos = np.full((self.max_cubos, 4), np.nan)  # x_min, y_min, x_max, y_max
+        self._n_cubos = 0
+        self._parcial_x = np.array([]); self._parcial_y = np.array([])
+
+    @staticmethod
+    def _extremos(x, y):
+        # Min y max por fila de matrices (cubos x ancho); filas todo-NaN quedan como NaN
+        bajos = np.where(np.isnan(y), np.inf, y); altos = np.where(np.isnan(y), -np.inf, y)
+        i_min = bajos.argmin(axis=1); i_max = altos.argmax(axis=1); filas = np.arange(len(y))
+        y_min = y[filas, i_min]; y_max = y[filas, i_max]
+        return np.column_stack([x[filas, i_min], y_min, x[filas, i_max], y_max])
+
+    def _fusionar(self):
+        pares = self._cubos[:self._n_cubos - self._n_cubos % 2].reshape(-1, 2, 4)
+        resto = self._cubos[self._n_cubos - self._n_cubos % 2:self._n_cubos]
+        y_min = pares[:, :, 1]; y_max = pares[:, :, 3]
+        i_min = np.where(np.isnan(y_min), np.inf, y_min).argmin(axis=1); i_max = np.where(np.isnan(y_max), -np.inf, y_max).argmax(axis=1)
+        filas = np.arange(len(pares))
+        fusionados = np.column_stack([pares[filas, i_min, 0], pares[filas, i_min, 1], pares[filas, i_max, 2], pares[filas, i_max, 3]])
+        nuevos = np.vstack([fusionados, resto])
+        self._cubos[:] = np.nan; self._cubos[:len(nuevos)] = nuevos; self._n_cubos = len(nuevos)
+        # El cubo impar sobrante tenía el ancho anterior; se acepta esa pequeña irregularidad al final
+        self.ancho *= 2
+
+    def agregar(self, x, y):
+        x = np.concatenate([self._parcial_x, np.asarray(x, dtype=float)]); y = np.concatenate([self._parcial_y, np.asarray(y, dtype=float)])
+        self.total += len(x) - len(self._parcial_x)
+        while len(x) >= self.ancho:
+            completos = len(x) // self.ancho
+            libres = self.max_cubos - self._n_cubos
+            if libres == 0: self._fusionar(); continue
+            usar = min(completos, libres); corte = usar * self.ancho
+            cubos = self._extremos(x[:corte].reshape(usar, self.ancho), y[:corte].reshape(usar, self.ancho))
+            self._cubos[self._n_cubos:self._n_cubos + usar] = cubos; self._n_cubos += usar
+            x = x[corte:]; y = y[corte:]
+        self._parcial_x = x; self._parcial_y = y
+
+    def puntos(self):
+        cubos = self._cubos[:self._n_cubos]
+        # Cada cubo aporta su mínimo y su máximo en orden temporal
+        primero_min = cubos[:, 0] <= cubos[:, 2]
+        xs = np.where(primero_min[:, None], cubos[:, [0, 2]], cubos[:, [2, 0]]).ravel()
+        ys = np.where(primero_min[:, None], cubos[:, [1, 3]], cubos[:, [3, 1]]).ravel()
+        # Si el mínimo y el máximo son el mismo punto (p.ej. cubos de ancho 1) se envía una sola vez
+        unicos = np.ones(len(xs), dtype=bool); unicos[1::2] = cubos[:, 0] != cubos[:, 2]
+        xs = xs[unicos]; ys = ys[unicos]
+        parcial_x, parcial_y = self._parcial_x, self._parcial_y
+        if len(parcial_x) > 2 and np.isfinite(parcial_y).any():
+            # El cubo en curso también se reduce a sus extremos para no superar el presupuesto
+            i_min, i_max = sorted((int(np.nanargmin(parcial_y)), int(np.nanargmax(parcial_y))))
+            parcial_x = parcial_x[[i_min, i_max, -1]]; parcial_y = parcial_y[[i_min, i_max, -1]]
+        return np.concatenate([xs, parcial_x]), np.concatenate([ys, parcial_y])
+
+
+# --- Figuras ---
+def _traza(x, y, nombre, n_total, **kwargs):
+    clase = go.Scattergl if n_total > UMBRAL_WEBGL else go.Scatter
+    return clase(x=x, y=y, name=nombre, **kwargs)
+
+def _ajustar_escala_y(fig, max_val):
+    if np.isfinite(max_val) and max_val > 0:
+        escala_plotly = 'log' if max_val > ESCALA_LOG_DESDE else 'linear'
+        fig.update_yaxes(type=escala_plotly, title_text=f"Tasa (Bytes/s) - Escala {escala_plotly.capitalize()}")
+
+
+@medida("graficos.figura")
+def crear_grafico_plotly_tasa(serie_tasas, anomalias_indices, presupuesto=PRESUPUESTO_PUNTOS):
+    if serie_tasas is None or len(serie_tasas) == 0: return None
+    y = np.asarray(serie_tasas, dtype=float); n = len(y)
+    anomalias = np.asarray([idx for idx in anomalias_indices if 0 <= idx < n], dtype=int)
+    indices = reducir_serie(y, anomalias, presupuesto)
+    modo = 'lines+markers' if len(indices) <= UMBRAL_MARCADORES else 'lines'
+    fig = go.Figure(_traza(indices, y[indices], 'Normal', len(indices), mode=modo, hovertemplate=PLANTILLA_NORMAL))
+    if len(anomalias) > 0:
+        fig.add_trace(_traza(anomalias, y[anomalias], 'Anomalía Detectada', len(anomalias), mode='markers',
+                             marker=dict(color='red', size=10), hovertemplate=PLANTILLA_ANOMALIA))
+    titulo = f'📈 Actividad de Red Local ({n} seg.)' if len(indices) == n else f'📈 Actividad de Red Local ({n} seg., {len(indices)} puntos dibujados)'
+    fig.update_layout(title=titulo, hovermode='x unified', legend_title_text='Estado', xaxis_title='Tiempo (s)', yaxis_title='Tasa (Bytes/s)')
+    with np.errstate(all='ignore'): _ajustar_escala_y(fig, np.nanmax(y) if np.isfinite(y).any() else np.nan)
+    return fig
+
+
+class GraficoTasa:
+    # Figura persistente: 'agregar' solo procesa los puntos nuevos y actualiza las trazas existentes,
+    # de modo que el coste y el tamaño de la figura no crecen con el historial
+    def __init__(self, titulo='📡 Actividad de Red en Directo', presupuesto=PRESUPUESTO_PUNTOS):
+        self.reductor = ReductorMinMax(presupuesto)
+        self.titulo = titulo
+        self._anomalias_x = np.array([]); self._anomalias_y = np.array([])
+        self._max_val = -np.inf
+        self.figura = go.Figure([go.Scatter(x=[], y=[], name='Normal', mode='lines', hovertemplate=PLANTILLA_NORMAL),
+                                 go.Scatter(x=[], y=[], name='Anomalía Detectada', mode='markers', marker=dict(color='red', size=8), hovertemplate=PLANTILLA_ANOMALIA)])
+        self.figura.update_layout(title=titulo, hovermode='x unified', legend_title_text='Estado', xaxis_title='Tiempo (s)', yaxis_title='Tasa (Bytes/s)', uirevision='directo')
+
+    @medida("graficos.directo")
+    def agregar(self, x, y, anomalos=None):
+        x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float)
+        if len(x) == 0: return self.figura
+        self.reductor.agregar(x, y)
+        if anomalos is not None and np.any(anomalos):
+            self._anomalias_x = np.concatenate([self._anomalias_x, x[anomalos]])[-MAXIMO_ANOMALIAS:]
+            self._anomalias_y = np.concatenate([self._anomalias_y, y[anomalos]])[-MAXIMO_ANOMALIAS:]
+        if np.isfinite(y).any(): self._max_val = max(self._max_val, float(np.nanmax(y)))
+        xs, ys = self.reductor.puntos()
+        if self.reductor.total > UMBRAL_WEBGL and not isinstance(self.figura.data[0], go.Scattergl):
+            # Cambio único a WebGL al superar el umbral; después solo se sustituyen los datos
+            self.figura.data = ()
+            self.figura.add_trace(go.Scattergl(x=[], y=[], name='Normal', mode='lines', hovertemplate=PLANTILLA_NORMAL))
+            self.figura.add_trace(go.Scattergl(x=[], y=[], name='Anomalía Detectada', mode='markers', marker=dict(color='red', size=8), hovertemplate=PLANTILLA_ANOMALIA))
+        with self.figura.batch_update():
+            self.figura.data[0].x = xs; self.figura.data[0].y = ys
+            self.figura.data[1].x = self._anomalias_x; self.figura.data[1].y = self._anomalias_y
+            _ajustar_escala_y(self.figura, self._max_val)
+        return self.figura
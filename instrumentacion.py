@@ -0,0 +1,68 @@
+# instrumentacion.py - Duraciones por etapa (colector, anomalías, gráficos, almacén, app) para el panel de depuración
+
+import contextlib
+import functools
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# --- Configuración ---
+MUESTRAS_POR_ETAPA = 1000   # Duraciones recientes conservadas por etapa (los percentiles se calculan sobre ellas)
+
+
+class Instrumentacion:
+    def __init__(self, capacidad=MUESTRAS_POR_ETAPA):
+        self.capacidad = capacidad
+        self._etapas = {}   # nombre -> [llamadas, total_s, deque de duraciones recientes, última marca de tiempo]
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre, duracion_s):
+        with self._lock:
+            etapa = self._etapas.get(nombre)
+            if etapa is None: etapa = self._etapas[nombre] = [0, 0.0, deque(maxlen=self.capacidad), None]
+            etapa[0] += 1; etapa[1] += duracion_s; etapa[2].append(duracion_s); etapa[3] = time.time()
+
+    @contextlib.contextmanager
+    def etapa(self, nombre):
+        inicio = time.perf_counter()
+        try: yield
+        finally: self.registrar(nombre, time.perf_counter() - inicio)
+
+    def medida(self, nombre):
+        # Decorador equivalente a envolver la función en 'etapa(nombre)'
+        def decorador(funcion):
+            @functools.wraps(funcion)
+            def envuelta(*args, **kwargs):
+                inicio = time.perf_counter()
+                try: return funcion(*args, **kwargs)
+                finally: self.registrar(nombre, time.perf_counter() - inicio)
+            return envuelta
+        return decorador
+
+    def resumen(self):
+        # Lista de dicts por etapa, de mayor a menor tiempo total
+        with self._lock: copia = {nombre: (n, total, np.array(recientes), ultima) for nombre, (n, total, recientes, ultima) in self._etapas.items()}
+        filas = []
+        for nombre, (n, total, recientes, ultima) in copia.items():
+            p50, p95 = np.percentile(recientes, [50, 95]) * 1000
+            filas.append({"etapa": nombre, "llamadas": n, "total_s": total, "ultima_ms": recientes[-1] * 1000, "p50_ms": p50,
+                          "p95_ms": p95, "max_ms": recientes.max() * 1000, "hace_s": time.time() - ultima})
+        return sorted(filas, key=lambda f: f["total_s"], reverse=True)
+
+    def reiniciar(self):
+        with self._lock: self._etapas.clear()
+
+
+# --- Instancia única por proceso ---
+_instrumentacion = Instrumentacion()
+
+def obtener_instrumentacion():
+    return _instrumentacion
+
+def medida(nombre):
+    return _instrumentacion.medida(nombre)
+
+def etapa(nombre):
+    return _instrumentacion.etapa(nombre)
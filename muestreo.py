@@ -0,0 +1,66 @@
+# muestreo.py - Muestreo de contadores por interfaz y dirección (psutil pernic=True)
+
+import numpy as np
+import psutil
+
+# Columnas de la matriz de contadores (mismo orden que psutil.snetio)
+METRICAS = ("bytes_sent", "bytes_recv", "packets_sent", "packets_recv", "errin", "errout", "dropin", "dropout")
+COLUMNAS_BYTES = (METRICAS.index("bytes_sent"), METRICAS.index("bytes_recv"))
+
+
+def listar_interfaces(fuente=psutil):
+    return sorted(fuente.net_io_counters(pernic=True).keys())
+
+
+def leer_contadores(interfaces, fuente=psutil):
+    # Matriz (interfaces x métricas); NaN para interfaces que han desaparecido.
+    # 'fuente' es cualquier objeto con net_io_counters(pernic, nowrap) (p.ej. sintetico.ContadoresSinteticos)
+    contadores = fuente.net_io_counters(pernic=True, nowrap=True)
+    fila_vacia = (np.nan,) * len(METRICAS)
+    return np.array([contadores.get(nombre, fila_vacia) for nombre in interfaces], dtype=np.float64).reshape(len(interfaces), len(METRICAS))
+
+
+def calcular_tasas(anteriores, actuales, delta_t, bits_contador=None):
+    # Tasas por segundo para toda la matriz a la vez.
+    # psutil (nowrap=True) ya corrige el desbordamiento de contadores de 32 bits; si se indica
+    # 'bits_contador' se corrige aquí también (solo si el valor anterior estaba en la mitad alta del
+    # rango). Un delta negativo restante se trata como reinicio del contador (interfaz recreada):
+    # se toma el valor actual como delta desde cero.
+    if delta_t <= 0: return np.full(np.shape(actuales), np.nan)
+    delta = actuales - anteriores
+    negativos = delta < 0
+    if bits_contador:
+        modulo = float(2 ** bits_contador)
+        desbordados = negativos & (anteriores >= modulo / 2) & (anteriores < modulo)
+        delta = np.where(desbordados, delta + modulo, delta); negativos &= ~desbordados
+    delta = np.where(negativos, actuales, delta)
+    return delta / delta_t
+
+
+class MuestreadorInterfaces:
+    def __init__(self, interfaces=None, bits_contador=None, fuente=psutil):
+        # La lista de interfaces se fija al crear el muestreador para que la forma del buffer sea estable
+        self.fuente = fuente
+        self.interfaces = tuple(interfaces) if interfaces else tuple(listar_interfaces(fuente))
+        self.bits_contador = bits_contador
+        self._anteriores = None; self._t_anterior = None
+
+    @property
+    def forma(self):
+        return (len(self.interfaces), len(METRICAS))
+
+    def muestrear(self, ahora):
+        # 'ahora' debe venir de un reloj monótono; devuelve None en la primera lectura
+        actuales = leer_contadores(self.interfaces, self.fuente)
+        tasas = None
+        if self._anteriores is not None:
+            tasas = calcular_tasas(self._anteriores, actuales, ahora - self._t_anterior, self.bits_contador)
+        self._anteriores = actuales; self._t_anterior = ahora
+        return tasas
+
+
+def tasa_total(tasas):
+    # Suma de bytes enviados + recibidos de todas las interfaces; acepta (..., interfaces, métricas)
+    bytes_dir = np.asarray(tasas)[..., list(COLUMNAS_BYTES)]
+    total = np.nansum(bytes_dir, axis=(-2, -1))
+    return np.where(np.isnan(bytes_dir).all(axis=(-2, -1)), np.nan, total)
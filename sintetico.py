@@ -0,0 +1,59 @@
+# sintetico.py - Tráfico sintético reproducible: series de tasa con ráfagas y huecos, y contadores con la interfaz de psutil
+
+import collections
+
+import numpy as np
+
+from muestreo import METRICAS
+
+# --- Configuración ---
+TASA_BASE_BPS = 2e5
+FRACCION_RAFAGAS = 0.002    # Probabilidad de que empiece una ráfaga en cada segundo
+FACTOR_RAFAGA = 20.0
+FRACCION_NAN = 0.01         # Muestras perdidas (huecos del colector)
+TAMANO_PAQUETE_MEDIO = 800
+
+snetio = collections.namedtuple("snetio", METRICAS)
+
+
+def serie_sintetica(n, tasa_base=TASA_BASE_BPS, fraccion_rafagas=FRACCION_RAFAGAS, factor_rafaga=FACTOR_RAFAGA,
+                    fraccion_nan=FRACCION_NAN, periodo_s=86400, semilla=0):
+    # Tasa (B/s) a 1 Hz con ciclo diario, ruido gamma, ráfagas de duración geométrica y NaN sueltos.
+    # Devuelve (tiempos, valores, en_rafaga); 'en_rafaga' es la verdad de terreno de las ráfagas inyectadas.
+    rng = np.random.default_rng(semilla); n = int(n)
+    tiempos = np.arange(n, dtype=float)
+    valores = tasa_base * (1 + 0.5 * np.sin(2 * np.pi * tiempos / periodo_s)) * rng.gamma(4.0, 0.25, n)
+    inicios = np.flatnonzero(rng.random(n) < fraccion_rafagas)
+    marcas = np.zeros(n + 1, dtype=int)
+    np.add.at(marcas, inicios, 1); np.add.at(marcas, np.minimum(inicios + rng.geometric(0.2, len(inicios)), n), -1)
+    en_rafaga = np.cumsum(marcas[:-1]) > 0
+    valores[en_rafaga] *= factor_rafaga
+    valores[rng.random(n) < fraccion_nan] = np.nan
+    return tiempos, valores, en_rafaga
+
+
+class ContadoresSinteticos:
+    # Sustituye a psutil como 'fuente' de muestreo.MuestreadorInterfaces: cada llamada a net_io_counters
+    # avanza 'paso_s' segundos de tráfico simulado en todas las interfaces
+    def __init__(self, interfaces=4, tasa_base=TASA_BASE_BPS, prob_rafaga=0.01, factor_rafaga=FACTOR_RAFAGA,
+                 tasa_errores=0.05, paso_s=1.0, semilla=0):
+        self.nombres = tuple(f"eth{i}" for i in range(interfaces)) if isinstance(interfaces, int) else tuple(interfaces)
+        self.tasa_base = tasa_base; self.prob_rafaga = prob_rafaga; self.factor_rafaga = factor_rafaga
+        self.tasa_errores = tasa_errores; self.paso_s = paso_s
+        self._rng = np.random.default_rng(semilla)
+        self._contadores = np.zeros((len(self.nombres), len(METRICAS)), dtype=np.int64)
+        self._incrementos = (); self._siguiente = 0
+
+    def net_io_counters(self, pernic=False, nowrap=True):
+        # Los incrementos se generan por bloques para que la fuente no domine el coste del muestreo que se mide
+        if self._siguiente >= len(self._incrementos): self._generar_bloque(); self._siguiente = 0
+        self._contadores += self._incrementos[self._siguiente]; self._siguiente += 1
+        if not pernic: return snetio._make(self._contadores.sum(axis=0).tolist())
+        return dict(zip(self.nombres, map(snetio._make, self._contadores.tolist())))
+
+    def _generar_bloque(self, pasos=1024):
+        n = len(self.nombres)
+        bytes_dir = self.tasa_base * self.paso_s * self._rng.gamma(4.0, 0.25, (pasos, n, 2))
+        bytes_dir[self._rng.random((pasos, n)) < self.prob_rafaga] *= self.factor_rafaga
+        errores = self._rng.poisson(self.tasa_errores * self.paso_s, (pasos, n, 4))   # errin, errout, dropin, dropout
+        self._incrementos = np.round(np.concatenate([bytes_dir, bytes_dir / TAMANO_PAQUETE_MEDIO, errores], axis=-1)).astype(np.int64)
@@ -0,0 +1,98 @@
+# sondeo.py - Sondeo de latencia concurrente a varios destinos (ICMP o TCP connect sin privilegios)
+
+import ipaddress
+import itertools
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+# --- Configuración ---
+PAQUETES_POR_DESTINO = 4
+TIMEOUT_S = 2
+CONCURRENCIA_MAXIMA = 32
+MAXIMO_DESTINOS = 256
+PUERTO_TCP = 443
+MODOS = ("auto", "icmp", "tcp")
+
+# Se desactiva la primera vez que ICMP falla por permisos, para no reintentarlo en cada destino
+_icmp_permitido = True
+
+
+def expandir_destinos(texto, maximo=MAXIMO_DESTINOS):
+    # Hosts, IPs o rangos CIDR separados por comas/espacios, sin duplicados y en orden
+    destinos = []
+    for parte in texto.replace(",", " ").split():
+        if "/" in parte:
+            red = ipaddress.ip_network(parte, strict=False)
+            # Se cuenta antes de enumerar: un /8 o un prefijo IPv6 no deben generarse solo para rechazarlos.
+            # hosts() excluye red y broadcast en IPv4 (salvo /31 y /32) y la dirección de red en IPv6 (salvo /127 y /128)
+            excluidas = (2 if red.version == 4 else 1) if red.num_addresses > 2 else 0
+            n_hosts = max(1, red.num_addresses - excluidas)
+            if n_hosts > maximo: raise ValueError(f"El rango {parte} tiene {n_hosts:,} hosts (máx. {maximo}).")
+            hosts = list(itertools.islice(red.hosts(), maximo + 1)) if red.num_addresses > 1 else [red.network_address]
+            destinos.extend(str(h) for h in hosts)
+        else: destinos.append(parte)
+    destinos = list(dict.fromkeys(destinos))
+    if len(destinos) > maximo: raise ValueError(f"Demasiados destinos ({len(destinos)}, máx. {maximo}).")
+    return destinos
+
+
+def rtts_icmp(host, count=PAQUETES_POR_DESTINO, timeout=TIMEOUT_S):
+    from pythonping import ping
+    return [r.time_elapsed_ms if r.success else None for r in ping(host, count=count, timeout=timeout, verbose=False)]
+
+
+def rtts_tcp(host, count=PAQUETES_POR_DESTINO, timeout=TIMEOUT_S, puerto=PUERTO_TCP):
+    # Tiempo de establecimiento de conexión TCP; un RST (conexión rechazada) también es una respuesta del host
+    familia, tipo, proto, _, direccion = socket.getaddrinfo(host, puerto, type=socket.SOCK_STREAM)[0]
+    rtts = []
+    for _ in range(count):
+        s = socket.socket(familia, tipo, proto); s.settimeout(timeout)
+        inicio = time.perf_counter()
+        try:
+            s.connect(direccion); rtts.append((time.perf_counter() - inicio) * 1000)
+        except ConnectionRefusedError: rtts.append((time.perf_counter() - inicio) * 1000)
+        except OSError: rtts.append(None)
+        finally: s.close()
+    return rtts
+
+
+def calcular_estadisticas(host, rtts, modo):
+    validos = np.array([r for r in rtts if r is not None], dtype=float)
+    enviados = len(rtts); recibidos = len(validos)
+    resultado = {"host": host, "modo": modo, "enviados": enviados, "recibidos": recibidos,
+                 "perdida": 1.0 - recibidos / enviados if enviados else 1.0, "rtts_ms": list(rtts)}
+    if recibidos:
+        p50, p95, p99 = np.percentile(validos, [50, 95, 99])
+        resultado.update(rtt_min_ms=float(validos.min()), rtt_avg_ms=float(validos.mean()), rtt_max_ms=float(validos.max()),
+                         p50_ms=float(p50), p95_ms=float(p95), p99_ms=float(p99),
+                         # Jitter como media de la variación entre respuestas consecutivas (RFC 3550)
+                         jitter_ms=float(np.abs(np.diff(validos)).mean()) if recibidos > 1 else 0.0)
+    else:
+        resultado.update({k: float('inf') for k in ("rtt_min_ms", "rtt_avg_ms", "rtt_max_ms", "p50_ms", "p95_ms", "p99_ms")}, jitter_ms=float('nan'))
+    return resultado
+
+
+def sondear_destino(host, modo="auto", count=PAQUETES_POR_DESTINO, timeout=TIMEOUT_S, puerto=PUERTO_TCP):
+    global _icmp_permitido
+    if modo == "icmp" or (modo == "auto" and _icmp_permitido):
+        try: return calcular_estadisticas(host, rtts_icmp(host, count, timeout), "icmp")
+        except PermissionError:
+            if modo == "icmp": raise
+            _icmp_permitido = False
+    return calcular_estadisticas(host, rtts_tcp(host, count, timeout, puerto), f"tcp/{puerto}")
+
+
+def sondear_destinos(destinos, modo="auto", count=PAQUETES_POR_DESTINO, timeout=TIMEOUT_S, puerto=PUERTO_TCP, concurrencia=CONCURRENCIA_MAXIMA):
+    # Generador: entrega el resultado de cada destino en cuanto termina (orden de llegada, no de entrada)
+    if modo not in MODOS: raise ValueError(f"Modo de sondeo no válido: {modo}")
+    if not destinos: return
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrencia, len(destinos))), thread_name_prefix="sondeo") as ejecutor:
+        futuros = {ejecutor.submit(sondear_destino, host, modo, count, timeout, puerto): host for host in destinos}
+        for futuro in as_completed(futuros):
+            host = futuros[futuro]
+            try: yield futuro.result()
+            except PermissionError: yield {"host": host, "modo": modo, "error": "Sin permisos para ICMP (usa el modo TCP)."}
+            except Exception as e: yield {"host": host, "modo": modo, "error": str(e)}
@@ -0,0 +1,33 @@
+# tarjetas.py - Tarjetas HTML de métricas (sin Streamlit, para poder medirlas y reutilizarlas fuera de la app)
+
+import functools
+
+import numpy as np
+
+
+# --- Tarjetas ---
+def formatear_valor(title, value):
+    # Depende del tipo (0 y 0.0 se muestran distinto), por eso no se cachea por valor
+    if value is None or not np.isfinite(value): return "N/A"
+    if isinstance(value, float):
+        if "Perdidos" in title: return f"{value:.1%}"
+        if "Mbps" in title: return f"{value:.2f}<span style='font-size: 0.6em;'> Mbps</span>"
+        if "ms" in title: return f"{value:.2f}<span style='font-size: 0.6em;'> ms</span>"
+        return f"{value:,.2f}"
+    if isinstance(value, int): return f"{value:,}"
+    return str(value)
+
+
+@functools.lru_cache(maxsize=256, typed=True)
+def html_tarjeta(title, display_value, icon="", key_suffix=""):
+    # Cacheada por el texto ya formateado: latencias distintas que se muestran igual reutilizan el HTML
+    return f"""
+    <div class="metric-card" key="card-{key_suffix}">
+        <div class="icon">{icon}</div>
+        <h3>{title}</h3>
+        <div class="value">{display_value}</div>
+    </div>"""
+
+
+def create_metric_card(title, value, icon="", key_suffix=""):
+    return html_tarjeta(title, formatear_valor(title, value), icon, key_suffix)
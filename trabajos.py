@@ -0,0 +1,179 @@
+# trabajos.py - Ejecución en segundo plano de pruebas largas (speedtest): un solo trabajo a la vez, caché y programación
+
+import datetime
+import http.server
+import itertools
+import threading
+import time
+import urllib.request
+
+# --- Configuración ---
+TTL_SERVIDOR_S = 3600     # Validez de la selección del mejor servidor
+TTL_RESULTADO_S = 300     # Un resultado más reciente que esto se devuelve sin repetir la prueba
+TIMEOUT_HTTP_S = 30
+
+EN_CURSO, COMPLETADO, ERROR = "en_curso", "completado", "error"
+_ids = itertools.count(1)
+
+
+class Trabajo:
+    def __init__(self):
+        self.id = next(_ids); self.estado = EN_CURSO
+        self.resultado = None; self.error = None
+        self.inicio = time.time(); self.fin = None
+        self._hecho = threading.Event()
+
+    @property
+    def terminado(self):
+        return self.estado != EN_CURSO
+
+    def esperar(self, timeout=None):
+        return self._hecho.wait(timeout)
+
+    def _terminar(self, estado, resultado=None, error=None):
+        self.resultado = resultado; self.error = error; self.fin = time.time(); self.estado = estado
+        self._hecho.set()
+
+
+# --- Backends intercambiables ---
+class BackendSpeedtestNet:
+    def __init__(self, secure=True):
+        self.secure = secure
+
+    def mejor_servidor(self):
+        import speedtest
+        return speedtest.Speedtest(secure=self.secure).get_best_server()
+
+    def medir(self, servidor):
+        import speedtest
+        st_test = speedtest.Speedtest(secure=self.secure)
+        # Con un único candidato solo se mide su latencia, sin volver a descubrir servidores
+        st_test.get_best_server([servidor]); st_test.download(); st_test.upload()
+        return st_test.results.dict()
+
+
+class BackendHTTP:
+    # Mide contra cualquier servidor HTTP que ofrezca GET /descarga?bytes=N, POST /subida y GET /latencia
+    # (p.ej. ServidorPruebaHTTP en local); devuelve el mismo formato que speedtest-cli
+    def __init__(self, url_base, bytes_descarga=10_000_000, bytes_subida=5_000_000, muestras_latencia=3):
+        self.url_base = url_base.rstrip("/")
+        self.bytes_descarga = bytes_descarga; self.bytes_subida = bytes_subida; self.muestras_latencia = muestras_latencia
+
+    def mejor_servidor(self):
+        return {"name": self.url_base, "url": self.url_base, "location": "Local", "country": "-"}
+
+    def _peticion(self, ruta, datos=None):
+        with urllib.request.urlopen(urllib.request.Request(self.url_base + ruta, data=datos), timeout=TIMEOUT_HTTP_S) as r:
+            return len(r.read())
+
+    def medir(self, servidor):
+        latencias = []
+        for _ in range(self.muestras_latencia):
+            inicio = time.perf_counter(); self._peticion("/latencia"); latencias.append((time.perf_counter() - inicio) * 1000)
+        inicio = time.perf_counter(); recibidos = self._peticion(f"/descarga?bytes={self.bytes_descarga}"); t_descarga = time.perf_counter() - inicio
+        inicio = time.perf_counter(); self._peticion("/subida", b"\0" * self.bytes_subida); t_subida = time.perf_counter() - inicio
+        return {"download": recibidos * 8 / t_descarga, "upload": self.bytes_subida * 8 / t_subida, "ping": min(latencias),
+                "server": dict(servidor), "client": {"ip": "N/A", "isp": "N/A"}, "bytes_received": recibidos, "bytes_sent": self.bytes_subida,
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+
+
+class _ManejadorPrueba(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/descarga"):
+            n = int(self.path.partition("bytes=")[2] or 0)
+            self.send_response(200); self.send_header("Content-Length", str(n)); self.end_headers()
+            bloque = b"\0" * 65536
+            while n > 0: self.wfile.write(bloque[:min(n, len(bloque))]); n -= len(bloque)
+        else:
+            self.send_response(200); self.send_header("Content-Length", "0"); self.end_headers()
+
+    def do_POST(self):
+        restantes = int(self.headers.get("Content-Length", 0))
+        while restantes > 0:
+            bloque = self.rfile.read(min(restantes, 65536))
+            if not bloque: break
+            restantes -= len(bloque)
+        self.send_response(200); self.send_header("Content-Length", "0"); self.end_headers()
+
+    def log_message(self, *args): pass
+
+
+class ServidorPruebaHTTP(http.server.ThreadingHTTPServer):
+    # Servidor HTTP local que sustituye a speedtest.net para pruebas sin red externa
+    daemon_threads = True
+
+    def __init__(self, direccion=("127.0.0.1", 0)):
+        super().__init__(direccion, _ManejadorPrueba)
+        threading.Thread(target=self.serve_forever, name="servidor-prueba-http", daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+# --- Ejecutor ---
+class EjecutorSpeedtest:
+    def __init__(self, backend=None, ttl_servidor_s=TTL_SERVIDOR_S, ttl_resultado_s=TTL_RESULTADO_S, almacen=None):
+        self.backend = backend or BackendSpeedtestNet()
+        self.ttl_servidor_s = ttl_servidor_s; self.ttl_resultado_s = ttl_resultado_s; self.almacen = almacen
+        self.ultimo = None   # Último trabajo completado con éxito
+        self._actual = None; self._servidor = None; self._servidor_t = 0.0
+        self._lock = threading.Lock()
+        self.intervalo_programado_s = None; self._parar_programa = threading.Event(); self._hilo_programa = None
+
+    @property
+    def actual(self):
+        return self._actual
+
+    def solicitar(self, forzar=False):
+        # Nunca lanza dos pruebas a la vez: las peticiones concurrentes se unen al trabajo en curso
+        with self._lock:
+            if self._actual is not None and not self._actual.terminado: return self._actual
+            if not forzar and self.ultimo is not None and time.time() - self.ultimo.fin < self.ttl_resultado_s: return self.ultimo
+            trabajo = self._actual = Trabajo()
+        threading.Thread(target=self._ejecutar, args=(trabajo,), name=f"speedtest-{trabajo.id}", daemon=True).start()
+        return trabajo
+
+    def _servidor_cacheado(self):
+        if self._servidor is None or time.time() - self._servidor_t > self.ttl_servidor_s:
+            self._servidor = self.backend.mejor_servidor(); self._servidor_t = time.time()
+        return self._servidor
+
+    def _ejecutar(self, trabajo):
+        try:
+            resultado = self.backend.medir(self._servidor_cacheado())
+        except Exception as e:
+            # El servidor cacheado puede ser la causa del fallo: se vuelve a elegir en el siguiente intento
+            self._servidor = None
+            trabajo._terminar(ERROR, error=f"{type(e).__name__}: {e}"); return
+        with self._lock:
+            trabajo._terminar(COMPLETADO, resultado=resultado); self.ultimo = trabajo
+        if self.almacen is not None:
+            self.almacen.agregar_registro("speedtest", trabajo.fin, download_bps=resultado.get('download'),
+                                          upload_bps=resultado.get('upload'), ping_ms=resultado.get('ping'))
+
+    # --- Ejecuciones periódicas ---
+    def programar(self, intervalo_s):
+        self.detener_programacion()
+        self.intervalo_programado_s = intervalo_s; self._parar_programa = threading.Event()
+        self._hilo_programa = threading.Thread(target=self._bucle_programa, args=(intervalo_s, self._parar_programa), name="speedtest-programado", daemon=True)
+        self._hilo_programa.start()
+
+    def detener_programacion(self):
+        self._parar_programa.set(); self.intervalo_programado_s = None
+
+    def _bucle_programa(self, intervalo_s, parar):
+        while not parar.wait(intervalo_s):
+            self.solicitar(forzar=True).esperar()
+
+
+# --- Instancia única por proceso ---
+_ejecutor = None
+_ejecutor_lock = threading.Lock()
+
+def obtener_ejecutor_speedtest(almacen=None):
+    # 'almacen' solo se aplica al crear la instancia (primera llamada del proceso)
+    global _ejecutor
+    with _ejecutor_lock:
+        if _ejecutor is None: _ejecutor = EjecutorSpeedtest(almacen=almacen)
+        return _ejecutor